@@ -1,20 +1,65 @@
+import asyncio
+import hashlib
+import hmac
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-import hashlib
+from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.config import JWT_SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.config import (
+    JWT_SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    BCRYPT_ROUNDS, HASH_POOL_WORKERS, HASH_QUEUE_MAX,
+)
 
 security = HTTPBearer()
 
-def hash_password(password: str) -> str:
-    """Hash password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt costs tens of ms of CPU, so it runs in its own small pool rather than
+# on the event loop; past HASH_QUEUE_MAX waiting jobs we shed load with a 503
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_POOL_WORKERS, thread_name_prefix="pwhash")
+_hash_pending = 0
+
+LEGACY_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+async def _run_hashing(func, *args):
+    global _hash_pending
+    if _hash_pending >= HASH_QUEUE_MAX:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_pool, func, *args)
+    finally:
+        _hash_pending -= 1
+
+def is_legacy_hash(hashed_password: str) -> bool:
+    """Hashes from before bcrypt were bare SHA-256 hex digests"""
+    return bool(LEGACY_SHA256_RE.match(hashed_password or ""))
+
+async def hash_password(password: str) -> str:
+    """Hash password with bcrypt (in the hashing pool)"""
+    return await _run_hashing(pwd_context.hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify password against a bcrypt or legacy SHA-256 hash"""
+    if is_legacy_hash(hashed_password):
+        legacy = hashlib.sha256(plain_password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, hashed_password)
+    try:
+        return await _run_hashing(pwd_context.verify, plain_password, hashed_password)
+    except ValueError:
+        # Unrecognised hash format
+        return False
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True for legacy hashes and bcrypt hashes below the configured cost"""
+    return is_legacy_hash(hashed_password) or pwd_context.needs_update(hashed_password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password against hash"""
-    return hash_password(plain_password) == hashed_password
+def hash_pool_stats() -> dict:
+    return {"workers": HASH_POOL_WORKERS, "pending": _hash_pending, "queue_max": HASH_QUEUE_MAX, "bcrypt_rounds": BCRYPT_ROUNDS}
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -35,7 +80,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         role: str = payload.get("role", "member")
         if email is None:
             raise credentials_exception
-        return {"email": email, "role": role}
+        # Tokens issued before member_id was added as a claim carry None here
+        return {"email": email, "role": role, "member_id": payload.get("member_id")}
     except JWTError:
         raise credentials_exception
 
@@ -0,0 +1,152 @@
+import codecs
+import csv
+import json
+import time
+from app.database import supabase
+from app.search import search_index
+
+MAX_REPORTED_ERRORS = 100
+
+def iter_records(file, fmt: str):
+    """Yield (line_number, record) from an uploaded file without loading it whole.
+
+    CSV needs a header row; NDJSON is one JSON object per line. Parse errors
+    are yielded as (line_number, Exception) so the caller can report them.
+    """
+    text = codecs.getreader("utf-8-sig")(file)
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+                yield line_number, record
+            except ValueError as e:
+                yield line_number, e
+
+def text_field(record: dict, field: str) -> str:
+    """Field as stripped text; NDJSON numbers (e.g. an ISBN) are converted"""
+    value = record.get(field)
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        raise ValueError(f"{field} must be text")
+    return str(value).strip()
+
+def to_book(record: dict, subject_id) -> tuple:
+    title = text_field(record, "title")
+    author = text_field(record, "author")
+    if not title or not author:
+        raise ValueError("title and author are required")
+    try:
+        copies = int(record.get("copies") or 1)
+    except (TypeError, ValueError):
+        raise ValueError("copies must be a whole number")
+    if copies < 0:
+        raise ValueError("copies must be >= 0")
+    # Every row carries the same keys, PostgREST bulk inserts need a uniform shape
+    book = {
+        "title": title,
+        "author": author,
+        "isbn": text_field(record, "isbn") or None,
+        "language": text_field(record, "language") or "English",
+    }
+    if subject_id:
+        book["subject_id"] = record.get("subject_id") or subject_id
+    return book, copies
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows_read = 0
+        self.books_created = 0
+        self.copies_created = 0
+        self.batches = 0
+        self.failed_rows = 0
+        self.errors = []
+
+    def error(self, line_number: int, message: str):
+        self.failed_rows += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows_read": self.rows_read,
+            "books_created": self.books_created,
+            "copies_created": self.copies_created,
+            "failed_rows": self.failed_rows,
+            "batches": self.batches,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows_read / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+            "errors_truncated": self.failed_rows > len(self.errors),
+        }
+
+async def insert_batch(batch: list, stats: ImportStats):
+    """Insert one batch of books, then all of their copies in a single call.
+
+    A bulk insert is all or nothing, so a rejected batch is split in half and
+    retried until the bad rows stand alone and get their own error lines. If
+    the copies are rejected, the batch's books are deleted again and each of
+    its lines is reported.
+    """
+    stats.batches += 1
+    result = await supabase.table("books").insert([book for _, book, _ in batch])
+    if not result.data:
+        if len(batch) == 1:
+            stats.error(batch[0][0], result.error or "insert failed")
+            return
+        middle = len(batch) // 2
+        await insert_batch(batch[:middle], stats)
+        await insert_batch(batch[middle:], stats)
+        return
+    # PostgREST returns inserted rows in request order
+    copies = [
+        {"book_id": row["id"], "copy_number": n, "condition": "Good", "is_available": True}
+        for row, (_, _, count) in zip(result.data, batch)
+        for n in range(1, count + 1)
+    ]
+    if copies:
+        created = await supabase.table("book_copies").insert(copies)
+        if created.error or len(created.data) != len(copies):
+            # Take the books back out rather than leave them without copies;
+            # deleting a book cascades to any copies that did go in
+            await supabase.table("books").in_("id", [row["id"] for row in result.data]).delete(returning="minimal")
+            for line_number, _, _ in batch:
+                stats.error(line_number, f"copies not created: {created.error or 'insert failed'}")
+            return
+        stats.copies_created += len(created.data)
+    stats.books_created += len(result.data)
+    for row in result.data:
+        search_index.add(row)
+
+async def import_books(file, fmt: str, batch_size: int) -> dict:
+    stats = ImportStats()
+    subjects = await supabase.table("subjects").select("id").limit(1).execute()
+    default_subject = subjects.data[0]["id"] if subjects.data else None
+    batch = []
+    for line_number, record in iter_records(file, fmt):
+        stats.rows_read += 1
+        if isinstance(record, Exception):
+            stats.error(line_number, f"parse error: {record}")
+            continue
+        try:
+            book, copies = to_book(record, default_subject)
+        except ValueError as e:
+            stats.error(line_number, str(e))
+            continue
+        batch.append((line_number, book, copies))
+        if len(batch) >= batch_size:
+            await insert_batch(batch, stats)
+            batch = []
+    if batch:
+        await insert_batch(batch, stats)
+    return stats.summary()
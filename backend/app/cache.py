@@ -0,0 +1,133 @@
+import functools
+import time
+from collections import OrderedDict
+from fastapi.responses import Response
+from app.config import CACHE_TTL, CACHE_MAX_ENTRIES
+
+class TTLCache:
+    """Bounded LRU cache with per-entry TTL and table-tagged invalidation"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags)
+        self._keys_by_tag = {}
+        # Bumped on every invalidation so in-flight reads don't store stale data
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, tags=(), ttl: float = None):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic() + (ttl or self.ttl), tuple(tags))
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def generation(self, tags) -> tuple:
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def invalidate(self, *tags):
+        """Drop every entry tagged with any of the given table names"""
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        for tag in list(self._keys_by_tag):
+            self.invalidate(tag)
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+response_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+
+def _make_key(name: str, kwargs: dict) -> tuple:
+    user = kwargs.get("user")
+    role = user.get("role", "member") if isinstance(user, dict) else "anon"
+    params = tuple(sorted((k, repr(v)) for k, v in kwargs.items() if k != "user"))
+    return (name, role, params)
+
+class _StoredResponse:
+    """What is kept of a Response: Starlette responses are single-use (and
+    middleware may add headers to them), so each hit gets a new one"""
+
+    def __init__(self, response: Response):
+        self.body = response.body
+        self.status_code = response.status_code
+        self.media_type = response.media_type
+        self.headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+
+    def build(self) -> Response:
+        return Response(content=self.body, status_code=self.status_code,
+                        media_type=self.media_type, headers=self.headers)
+
+def cached(*tables, ttl: float = None):
+    """Read-through cache for an endpoint whose result depends on the given tables.
+
+    The key is the endpoint name, the caller's role and its query params.
+    Write endpoints call invalidate() with the tables they touch.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = _make_key(func.__name__, kwargs)
+            value = response_cache.get(key)
+            if value is not None:
+                return value.build() if isinstance(value, _StoredResponse) else value
+            generation = response_cache.generation(tables)
+            value = await func(*args, **kwargs)
+            # Skip the store if a write to one of our tables landed meanwhile
+            if response_cache.generation(tables) == generation:
+                stored = _StoredResponse(value) if isinstance(value, Response) else value
+                response_cache.set(key, stored, tags=tables, ttl=ttl)
+            return value
+        return wrapper
+    return decorator
+
+def invalidate(*tables):
+    response_cache.invalidate(*tables)
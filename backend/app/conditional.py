@@ -0,0 +1,58 @@
+import hashlib
+
+# Streaming exports and the metrics scrape are never buffered for hashing
+SKIP_PREFIXES = ("/static/", "/admin/export/", "/metrics")
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/"x" matches "x" """
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+class ConditionalGetMiddleware:
+    """Strong ETags on JSON GET responses, answering If-None-Match with 304.
+
+    Sits inside GZipMiddleware, so the hash is of the uncompressed body and a
+    304 skips compression (and the transfer) entirely. Streaming responses
+    pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"].startswith(SKIP_PREFIXES):
+            return await self.app(scope, receive, send)
+        request_headers = dict(scope.get("headers") or [])
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1")
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            # First body message: only whole, successful bodies get an ETag
+            if message.get("more_body") or start["status"] != 200:
+                passthrough = True
+                await send(start)
+                return await send(message)
+            etag = etag_for(message.get("body", b""))
+            headers = [(k, v) for k, v in start["headers"] if k.lower() not in (b"etag", b"cache-control")]
+            # Cached by the browser but revalidated on every use
+            headers += [(b"etag", etag.encode()), (b"cache-control", b"private, no-cache")]
+            if if_none_match and etag_matches(if_none_match, etag):
+                headers = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"content-type")]
+                await send({"type": "http.response.start", "status": 304, "headers": headers})
+                return await send({"type": "http.response.body", "body": b""})
+            await send({**start, "headers": headers})
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
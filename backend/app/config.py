@@ -8,6 +8,74 @@ if not os.getenv("SUPABASE_URL"):
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+# supabase (PostgREST) or sqlite (local file, see app/sqlite_storage.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "library.db")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "secret-key")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+# Shared upstream HTTP connection pool (see SupabaseClient)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+
+# Read-through response cache (see app/cache.py)
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+
+# In-memory catalog search index (see app/search.py)
+SEARCH_RECONCILE_SECONDS = float(os.getenv("SEARCH_RECONCILE_SECONDS", "600"))
+
+# Password hashing (bcrypt, run off the event loop in a bounded pool)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "64"))
+
+# Logging and metrics (see app/logging_setup.py, app/metrics.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # text | json
+
+# Upstream resilience: request deadlines, retries and circuit breaker (see app/resilience.py)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "10"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.1"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "1"))
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_FAILURE_RATIO = float(os.getenv("CIRCUIT_FAILURE_RATIO", "0.5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "15"))
+
+# Admission control: bounded upstream concurrency and per-client rate limits (see app/ratelimit.py)
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", str(HTTP_POOL_MAX_CONNECTIONS)))
+UPSTREAM_QUEUE_MAX = int(os.getenv("UPSTREAM_QUEUE_MAX", "100"))
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# group=requests/seconds; groups are auth, analytics, desk, admin and api (everything else)
+RATE_LIMITS = os.getenv("RATE_LIMITS", "auth=20/60,analytics=30/60,desk=300/60,admin=120/60,api=240/60")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+# Proxies (IPs or CIDRs, comma-separated, "*" for any) whose X-Forwarded-For
+# is believed when keying anonymous clients; behind Render's proxy use "*"
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+
+# Server-sent dashboard events (see app/events.py)
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+SSE_HISTORY = int(os.getenv("SSE_HISTORY", "500"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Library pulse counters (see app/pulse.py)
+PULSE_RECONCILE_SECONDS = float(os.getenv("PULSE_RECONCILE_SECONDS", "300"))
+
+# Overdue fines batch job (see app/fines.py)
+FINES_INTERVAL_SECONDS = float(os.getenv("FINES_INTERVAL_SECONDS", "3600"))
+# member_type=fine per day overdue; "default" covers any other type
+FINE_RATES = os.getenv("FINE_RATES", "Student=1,Faculty=0.5,Staff=0.5,default=1")
+FINE_GRACE_DAYS = int(os.getenv("FINE_GRACE_DAYS", "0"))
+FINE_MAX = float(os.getenv("FINE_MAX", "100"))
+
+# Co-borrowing recommendations (see app/recommend.py)
+RECOMMEND_NEIGHBOURS = int(os.getenv("RECOMMEND_NEIGHBOURS", "20"))
+RECOMMEND_REBUILD_SECONDS = float(os.getenv("RECOMMEND_REBUILD_SECONDS", "3600"))
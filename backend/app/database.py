@@ -1,148 +1,365 @@
+import asyncio
+import logging
+import time
 import httpx
-from app.config import SUPABASE_URL, SUPABASE_ANON_KEY
+from urllib.parse import quote
+from app.config import (
+    SUPABASE_URL, SUPABASE_ANON_KEY, STORAGE_BACKEND, SQLITE_PATH,
+    HTTP2_ENABLED, HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT, HTTP_POOL_TIMEOUT, HTTP_RETRIES,
+    UPSTREAM_CONCURRENCY, UPSTREAM_QUEUE_MAX,
+)
+from app.metrics import observe_upstream, observe_upstream_error
+from app.resilience import (
+    CircuitBreaker, UpstreamOverloaded, UpstreamTimeout, UpstreamUnavailable, backoff_delay, remaining_budget,
+)
+from app.storage import Storage, TableQuery, RawResponse, SupabaseResponse, _SAFE_CHARS
+
+logger = logging.getLogger(__name__)
+
+# Gateway errors worth retrying; other 5xx are answers, not blips
+RETRY_STATUSES = {502, 503, 504}
+# Failures where the request never reached PostgREST, so even writes can be retried
+NEVER_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class SupabaseClient(Storage):
+    """Storage backed by Supabase's PostgREST API over a shared HTTP pool"""
 
-class SupabaseClient:
     def __init__(self, url: str, key: str):
         if not url or not key:
             raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
         self.url = url
         self.key = key
+        self._http = None
+        # Pool utilisation counters
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests_total = 0
+        self._clients_opened = 0
+        # Single-flight: identical in-flight GETs share one upstream request
+        self._inflight_reads = {}
+        self._coalesced_total = 0
+        self.breaker = CircuitBreaker()
+        self._retries_total = 0
+        # Admission control: at most UPSTREAM_CONCURRENCY calls in flight per
+        # process, and past UPSTREAM_QUEUE_MAX waiters new calls are shed
+        self._slots = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+        self._waiting = 0
+        self._shed_total = 0
 
-    def table(self, name: str):
-        return SupabaseTable(self.url, self.key, name)
+    async def open(self):
+        """Open the shared keep-alive client (called on app startup)"""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                http2=HTTP2_ENABLED,
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT),
+            )
+            self._clients_opened += 1
+        return self._http
 
-class SupabaseTable:
-    def __init__(self, url: str, key: str, table: str):
-        self.base_url = f"{url}/rest/v1/{table}"
-        self.key = key
-        self.params = {}
-        self._select_cols = "*"
-    
-    def _get_headers(self):
+    async def close(self):
+        """Close the shared client and its pooled connections (called on app shutdown)"""
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+    async def request(self, method: str, url: str, headers: dict, timeout: float = None, **kwargs):
+        """Send a request through the shared pool, opening it lazily if needed.
+
+        Concurrent identical GET/HEAD requests are coalesced: the first caller
+        starts the upstream call and the rest await the same response.
+        """
+        if method not in ("GET", "HEAD"):
+            return await self._send(method, url, headers, timeout, **kwargs)
+        key = (method, url, headers.get("Prefer"))
+        task = self._inflight_reads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._send(method, url, headers, timeout, **kwargs))
+            self._inflight_reads[key] = task
+            task.add_done_callback(lambda t: self._read_done(key, t))
+        else:
+            self._coalesced_total += 1
+        # Shielded so one caller being cancelled doesn't cancel the shared call
+        return await asyncio.shield(task)
+
+    def _read_done(self, key, task):
+        if self._inflight_reads.get(key) is task:
+            del self._inflight_reads[key]
+        # Mark the exception retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _send(self, method: str, url: str, headers: dict, timeout: float = None, **kwargs):
+        """One logical upstream call: admitted through the process-wide slot
+        semaphore, bounded by the request deadline, retried with jittered
+        backoff when that is safe, and refused while the circuit is open.
+        Failures raise UpstreamTimeout / UpstreamUnavailable."""
+        client = await self.open()
+        idempotent = method in ("GET", "HEAD")
+        attempt = 0
+        while True:
+            budget = remaining_budget()
+            if budget is not None and budget <= 0:
+                raise UpstreamTimeout("Request deadline exceeded before the database answered")
+            await self._acquire_slot(budget)
+            try:
+                self.breaker.before_call()
+                response = await self._attempt(client, method, url, headers, timeout, remaining_budget(), **kwargs)
+            except (httpx.TimeoutException, asyncio.TimeoutError) as e:
+                self.breaker.record(False)
+                error = UpstreamTimeout(f"Database timed out ({type(e).__name__})")
+                retryable = idempotent or isinstance(e, NEVER_SENT)
+            except httpx.TransportError as e:
+                self.breaker.record(False)
+                error = UpstreamUnavailable(f"Database unreachable ({type(e).__name__})")
+                retryable = idempotent or isinstance(e, NEVER_SENT)
+            else:
+                if response.status_code < 500:
+                    self.breaker.record(True)
+                    return response
+                self.breaker.record(False)
+                error_type = UpstreamTimeout if response.status_code == 504 else UpstreamUnavailable
+                error = error_type(f"Database returned {response.status_code}")
+                retryable = idempotent and response.status_code in RETRY_STATUSES
+            finally:
+                self._slots.release()
+            attempt += 1
+            delay = backoff_delay(attempt - 1)
+            budget = remaining_budget()
+            if not retryable or attempt > HTTP_RETRIES or (budget is not None and budget <= delay):
+                logger.warning("%s %s failed after %d attempt(s): %s", method, url.split("?", 1)[0], attempt, error)
+                raise error
+            self._retries_total += 1
+            logger.info("Retrying %s %s in %.2fs: %s", method, url.split("?", 1)[0], delay, error)
+            await asyncio.sleep(delay)
+
+    async def _acquire_slot(self, budget: float):
+        if self._slots.locked() and self._waiting >= UPSTREAM_QUEUE_MAX:
+            self._shed_total += 1
+            raise UpstreamOverloaded("Too many database calls queued, try again shortly", retry_after=1)
+        self._waiting += 1
+        try:
+            await (asyncio.wait_for(self._slots.acquire(), budget) if budget is not None else self._slots.acquire())
+        except asyncio.TimeoutError:
+            raise UpstreamTimeout("Request deadline exceeded waiting for a database slot")
+        finally:
+            self._waiting -= 1
+
+    async def _attempt(self, client, method: str, url: str, headers: dict, timeout: float, budget: float, **kwargs):
+        timeout = timeout or HTTP_TIMEOUT
+        if budget is not None:
+            timeout = min(timeout, budget)
+        kwargs["timeout"] = httpx.Timeout(timeout, connect=min(timeout, HTTP_CONNECT_TIMEOUT),
+                                          pool=min(timeout, HTTP_POOL_TIMEOUT))
+        self._in_flight += 1
+        self._requests_total += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        started = time.perf_counter()
+        try:
+            call = client.request(method, url, headers=headers, **kwargs)
+            # httpx timeouts are per phase; the deadline caps the whole exchange
+            response = await (asyncio.wait_for(call, budget) if budget is not None else call)
+        except Exception as e:
+            observe_upstream_error(method, url, e)
+            raise
+        else:
+            observe_upstream(method, url, time.perf_counter() - started, response.status_code)
+            return response
+        finally:
+            self._in_flight -= 1
+
+    def pool_stats(self) -> dict:
+        """Connection pool utilisation, for sizing the pool limits under load"""
+        connections = []
+        if self._http is not None and not self._http.is_closed:
+            # httpcore keeps the live connections on the transport's pool
+            pool = getattr(getattr(self._http, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+        idle = len([c for c in connections if c.is_idle()])
+        http2 = len([c for c in connections if "HTTP/2" in repr(c)])
         return {
+            "http2_enabled": HTTP2_ENABLED,
+            "max_connections": HTTP_POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_POOL_MAX_KEEPALIVE,
+            "open_connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle,
+            "http2_connections": http2,
+            "in_flight_requests": self._in_flight,
+            "peak_in_flight_requests": self._peak_in_flight,
+            "requests_total": self._requests_total,
+            "clients_opened": self._clients_opened,
+            "coalesced_requests_total": self._coalesced_total,
+            "inflight_reads": len(self._inflight_reads),
+            "retries_total": self._retries_total,
+            "upstream_concurrency": UPSTREAM_CONCURRENCY,
+            "queued_calls": self._waiting,
+            "shed_calls_total": self._shed_total,
+            "circuit": self.breaker.stats(),
+        }
+
+    def table(self, name: str):
+        return SupabaseTable(self, name)
+
+    async def rpc(self, function: str, params: dict = None):
+        """Call a Postgres function through PostgREST (POST /rpc/<function>).
+
+        A database-side RAISE comes back as SupabaseResponse.error with the
+        exception message, so callers can surface it as a 4xx; an unreachable
+        database raises UpstreamError instead.
+        """
+        url = f"{self.url}/rest/v1/rpc/{function}"
+        headers = {
             "apikey": self.key,
             "Authorization": f"Bearer {self.key}",
             "Content-Type": "application/json",
-            "Prefer": "return=representation"
         }
-    
-    def _clone(self):
-        """Create a copy to avoid param pollution"""
-        new_table = SupabaseTable.__new__(SupabaseTable)
-        new_table.base_url = self.base_url
-        new_table.key = self.key
-        new_table.params = self.params.copy()
-        new_table._select_cols = self._select_cols
-        return new_table
-    
-    def select(self, columns: str = "*", count: str = None):
-        clone = self._clone()
-        clone._select_cols = columns
-        return clone
-    
-    def eq(self, column: str, value):
-        clone = self._clone()
-        clone.params[column] = f"eq.{value}"
-        return clone
-    
-    async def delete(self):
-        url = self.base_url
-        if not self.params:
-            print(f"DELETE ERROR: No filter params set for {url}")
-            return SupabaseResponse([])
-        
-        for key, val in self.params.items():
-            url += f"?{key}={val}" if "?" not in url else f"&{key}={val}"
-        
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.delete(url, headers=self._get_headers())
-                print(f"DELETE {url}: status={response.status_code}, response={response.text[:200] if response.text else 'empty'}")
-                result = []
-                if response.status_code in [200, 204]:
-                    try:
-                        if response.text:
-                            result = response.json()
-                    except:
-                        pass
-                else:
-                    print(f"DELETE error: {response.status_code} - {response.text}")
-                return SupabaseResponse(result)
-        except Exception as e:
-            print(f"DELETE exception: {e}")
-            return SupabaseResponse([])
-    
-    def order(self, column: str, desc: bool = False):
-        clone = self._clone()
-        clone.params["order"] = f"{column}.desc" if desc else column
-        return clone
-    
-    def limit(self, count: int):
-        clone = self._clone()
-        clone.params["limit"] = str(count)
-        return clone
-    
-    async def execute(self):
-        url = f"{self.base_url}?select={self._select_cols}"
-        for key, val in self.params.items():
-            url += f"&{key}={val}"
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url, headers=self._get_headers())
-                if response.status_code == 200:
-                    data = response.json()
-                else:
-                    print(f"SELECT error: {response.status_code} - {response.text[:200] if response.text else 'empty'}")
-                    data = []
-                return SupabaseResponse(data)
-        except Exception as e:
-            print(f"SELECT exception: {e}")
-            return SupabaseResponse([])
-    
-    async def insert(self, data: dict | list):
+        response = await self.request("POST", url, headers, json=params or {})
+        if response.status_code in [200, 201, 204]:
+            return SupabaseResponse(response.json() if response.text else [])
+        logger.warning("RPC %s error: %s - %s", function, response.status_code, response.text[:200] or "empty")
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(self.base_url, headers=self._get_headers(), json=data)
-                print(f"INSERT {self.base_url}: status={response.status_code}")
+            message = response.json().get("message")
+        except Exception:
+            message = None
+        return SupabaseResponse([], error=message or f"RPC {function} failed")
+
+class SupabaseTable(TableQuery):
+    def __init__(self, client: SupabaseClient, table: str):
+        super().__init__(table)
+        self.client = client
+        self.base_url = f"{client.url}/rest/v1/{table}"
+        self.key = client.key
+
+    def _get_headers(self, returning: str = "representation"):
+        prefer = f"return={returning}"
+        if self._count:
+            prefer += f",count={self._count}"
+        return {
+            "apikey": self.key,
+            "Authorization": f"Bearer {self.key}",
+            "Content-Type": "application/json",
+            "Prefer": prefer
+        }
+
+    def _build_url(self, with_select: bool = False) -> str:
+        pairs = []
+        if with_select:
+            pairs.append(("select", self._select_cols))
+        pairs.extend(self.filters)
+        pairs.extend(self.params.items())
+        if not pairs:
+            return self.base_url
+        query = "&".join(f"{quote(k, safe='')}={quote(str(v), safe=_SAFE_CHARS)}" for k, v in pairs)
+        return f"{self.base_url}?{query}"
+
+    async def execute(self, raw: bool = False):
+        """Run the query. raw=True skips decoding and returns a RawResponse
+        with PostgREST's JSON bytes, for endpoints that pass rows through as-is."""
+        url = self._build_url(with_select=True)
+        method = "HEAD" if self._head else "GET"
+        response = await self.client.request(method, url, self._get_headers(), timeout=self._timeout)
+        ok = response.status_code in [200, 206]
+        if not ok:
+            logger.warning("SELECT error: %s - %s", response.status_code, response.text[:200] or "empty")
+        count = _parse_content_range(response.headers.get("content-range")) if self._count else None
+        if raw:
+            rows = _content_range_rows(response.headers.get("content-range")) if ok else 0
+            return RawResponse(response.content if ok and not self._head else b"[]", rows, count)
+        data = response.json() if ok and not self._head else []
+        return SupabaseResponse(data, count=count)
+
+    async def insert(self, data: dict | list, on_conflict: str = None):
+        """Insert rows; with on_conflict (unique columns) an existing row that
+        collides is updated instead, i.e. an upsert. A rejected insert comes
+        back with the database's message in SupabaseResponse.error."""
+        url, headers = self.base_url, self._get_headers()
+        if on_conflict:
+            url = f"{url}?on_conflict={quote(on_conflict, safe=_SAFE_CHARS)}"
+            headers["Prefer"] += ",resolution=merge-duplicates"
+        response = await self.client.request("POST", url, headers, timeout=self._timeout, json=data)
+        logger.debug("INSERT %s: status=%s", url, response.status_code)
+        result = []
+        error = None
+        if response.status_code in [200, 201]:
+            try:
+                result = response.json()
+                if not isinstance(result, list):
+                    result = [result] if result else []
+            except:
                 result = []
-                if response.status_code in [200, 201]:
-                    try:
-                        result = response.json()
-                        if not isinstance(result, list):
-                            result = [result] if result else []
-                    except:
-                        result = []
-                else:
-                    print(f"INSERT error: {response.text[:200] if response.text else 'empty'}")
-                return SupabaseResponse(result)
-        except Exception as e:
-            print(f"INSERT exception: {e}")
-            return SupabaseResponse([])
-    
-    async def update(self, data: dict):
-        url = self.base_url
-        for key, val in self.params.items():
-            url += f"?{key}={val}" if "?" not in url else f"&{key}={val}"
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.patch(url, headers=self._get_headers(), json=data)
-                print(f"UPDATE {url}: status={response.status_code}")
+        else:
+            logger.warning("INSERT error: %s - %s", response.status_code, response.text[:200] or "empty")
+            try:
+                error = response.json().get("message")
+            except Exception:
+                pass
+            error = error or f"insert into {self.table_name} failed"
+        return SupabaseResponse(result, error=error)
+
+    async def update(self, data: dict, returning: str = "representation"):
+        """Update matching rows; returning='minimal' skips sending them back"""
+        url = self._build_url()
+        response = await self.client.request("PATCH", url, self._get_headers(returning), timeout=self._timeout, json=data)
+        logger.debug("UPDATE %s: status=%s", url, response.status_code)
+        result = []
+        if response.status_code in [200, 201, 204]:
+            try:
+                if response.text:
+                    result = response.json()
+            except:
                 result = []
-                if response.status_code in [200, 201]:
-                    try:
-                        result = response.json()
-                    except:
-                        result = []
-                else:
-                    print(f"UPDATE error: {response.text[:200] if response.text else 'empty'}")
-                return SupabaseResponse(result)
-        except Exception as e:
-            print(f"UPDATE exception: {e}")
+        else:
+            logger.warning("UPDATE error: %s - %s", response.status_code, response.text[:200] or "empty")
+        return SupabaseResponse(result)
+
+    async def delete(self, returning: str = "representation"):
+        """Delete matching rows; returning='minimal' skips sending them back"""
+        if not self.filters:
+            logger.error("DELETE refused: no filter params set for %s", self.base_url)
             return SupabaseResponse([])
+        url = self._build_url()
+        response = await self.client.request("DELETE", url, self._get_headers(returning), timeout=self._timeout)
+        logger.debug("DELETE %s: status=%s", url, response.status_code)
+        result = []
+        if response.status_code in [200, 204]:
+            try:
+                if response.text:
+                    result = response.json()
+            except:
+                pass
+        else:
+            logger.warning("DELETE error: %s - %s", response.status_code, response.text[:200] or "empty")
+        return SupabaseResponse(result)
+
+def _parse_content_range(value: str):
+    """Total from a PostgREST Content-Range header such as '0-24/3573' or '*/0'"""
+    if not value or "/" not in value:
+        return None
+    total = value.rsplit("/", 1)[1]
+    return int(total) if total.isdigit() else None
+
+def _content_range_rows(value: str) -> int:
+    """Rows in this response from a Content-Range such as '0-24/3573' (25) or '*/0'"""
+    span = (value or "").split("/", 1)[0]
+    if "-" not in span:
+        return 0
+    first, last = span.split("-", 1)
+    return int(last) - int(first) + 1
 
-class SupabaseResponse:
-    def __init__(self, data):
-        self.data = data if isinstance(data, list) else [data] if data else []
-        self.count = len(self.data)
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """The configured backend: PostgREST (default) or a local SQLite file"""
+    if backend == "sqlite":
+        from app.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(SQLITE_PATH)
+    if backend != "supabase":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    return SupabaseClient(SUPABASE_URL, SUPABASE_ANON_KEY)
 
-supabase = SupabaseClient(SUPABASE_URL, SUPABASE_ANON_KEY)
+# Keeps its historical name; with STORAGE_BACKEND=sqlite it is the SQLite store
+supabase = create_storage()
@@ -0,0 +1,233 @@
+import asyncio
+import bisect
+import logging
+import re
+from abc import ABC, abstractmethod
+from itertools import islice
+from app.database import supabase
+from app.export import iter_rows
+from app.pagination import paginate
+from app.resilience import detach_deadline
+
+WORD_RE = re.compile(r"[a-z0-9@._+-]+")
+PHONE_RE = re.compile(r"\+?\d[\d-]*")
+
+logger = logging.getLogger(__name__)
+
+def keys_for(*values) -> set:
+    """Prefix keys for a record: each word plus the whole lower-cased value"""
+    keys = set()
+    for value in values:
+        text = (value or "").strip().lower()
+        if text:
+            keys.add(text)
+            keys.update(WORD_RE.findall(text))
+    return keys
+
+class PrefixLookup(ABC):
+    """Sorted (key, id) list answering prefix queries with bisect.
+
+    Subclasses read their records in load(). refresh() builds a fresh
+    index from it and swaps it in; writes made to this one meanwhile are
+    journaled and replayed on the fresh one first, so the swap can't drop
+    them. mark_stale() schedules a single background reload however many
+    writes ask for one.
+    """
+
+    # What refresh() logs it loaded, e.g. "members"
+    noun = "records"
+
+    def __init__(self):
+        self.entries = []   # sorted (key, record_id)
+        self.records = {}   # record_id -> record
+        self.keys = {}      # record_id -> set of keys
+        self.loaded = False
+        self._sorted = True
+        self._refreshing = False
+        self._journal = []
+        self._refresh_task = None
+        self._stale_again = False
+
+    def _journal_write(self, op: str, *args):
+        """Note a public write so refresh() can replay it on the fresh index"""
+        if self._refreshing:
+            self._journal.append((op, args))
+
+    def put(self, record_id: str, record: dict, keys: set):
+        self._remove(record_id)
+        self.records[record_id] = record
+        self.keys[record_id] = keys
+        if self._sorted:
+            for key in keys:
+                bisect.insort(self.entries, (key, record_id))
+        else:
+            self.entries.extend((key, record_id) for key in keys)
+
+    def _bulk_load(self):
+        """Append entries unsorted until _replace(); insort per key would make
+        a full load quadratic"""
+        self._sorted = False
+
+    def remove(self, record_id: str):
+        self._journal_write("remove", record_id)
+        self._remove(record_id)
+
+    def _remove(self, record_id: str):
+        for key in self.keys.pop(record_id, ()):
+            if not self._sorted:
+                self.entries.remove((key, record_id))
+                continue
+            i = bisect.bisect_left(self.entries, (key, record_id))
+            if i < len(self.entries) and self.entries[i] == (key, record_id):
+                self.entries.pop(i)
+        self.records.pop(record_id, None)
+
+    def _replace(self, fresh):
+        if not fresh._sorted:
+            fresh.entries.sort()
+            fresh._sorted = True
+        self.entries, self.records, self.keys = fresh.entries, fresh.records, fresh.keys
+        self.loaded = True
+
+    def lookup(self, query: str, limit: int = 10) -> list:
+        # Phone numbers are indexed as bare digits, so "555-1234" -> "5551234"
+        words = [re.sub(r"\D", "", w) if PHONE_RE.fullmatch(w) else w
+                 for w in WORD_RE.findall((query or "").lower())]
+        if not words:
+            return list(islice(self.records.values(), limit))
+        # Walk the longest word's prefix range, then require every other word
+        # to prefix-match one of the record's keys
+        anchor = max(words, key=len)
+        others = [w for w in words if w != anchor]
+        results, seen = [], set()
+        i = bisect.bisect_left(self.entries, (anchor,))
+        while i < len(self.entries) and len(results) < limit:
+            key, record_id = self.entries[i]
+            if not key.startswith(anchor):
+                break
+            i += 1
+            if record_id in seen:
+                continue
+            seen.add(record_id)
+            record_keys = self.keys[record_id]
+            if all(any(k.startswith(w) for k in record_keys) for w in others):
+                results.append(self.records[record_id])
+        return results
+
+    @abstractmethod
+    async def load(self, fresh):
+        """Read every record from the database into `fresh`"""
+
+    async def refresh(self):
+        fresh = type(self)()
+        fresh._bulk_load()
+        self._refreshing, self._journal = True, []
+        try:
+            await self.load(fresh)
+            for op, args in self._journal:
+                getattr(fresh, op)(*args)
+        finally:
+            self._refreshing, self._journal = False, []
+        self._replace(fresh)
+        logger.info("Loaded %d %s", len(self.records), self.noun)
+
+    def mark_stale(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._safe_refresh())
+        elif self._refreshing:
+            # The running reload may have read past the change already
+            self._stale_again = True
+
+    async def _safe_refresh(self):
+        # Usually scheduled from a request handler; the reload outlives it
+        detach_deadline()
+        while True:
+            self._stale_again = False
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.exception("%s refresh failed: %s", type(self).__name__, e)
+            if not self._stale_again:
+                break
+
+class MemberLookup(PrefixLookup):
+    """Member typeahead on name, email and phone"""
+
+    noun = "members"
+
+    def add_member(self, member: dict):
+        self._journal_write("add_member", member)
+        record = {k: member.get(k) for k in ("id", "full_name", "email", "phone", "member_type")}
+        keys = keys_for(member.get("full_name"), member.get("email"))
+        # Every digit suffix of 4+, so a number matches with or without country code
+        digits = re.sub(r"\D", "", member.get("phone") or "")
+        keys.update(digits[i:] for i in range(max(len(digits) - 3, 0)))
+        self.put(str(member["id"]), record, keys)
+
+    async def load(self, fresh):
+        async for rows in iter_rows("members"):
+            for member in rows:
+                fresh.add_member(member)
+
+class CopyLookup(PrefixLookup):
+    """Available-copy typeahead on title and author, one record per book
+    listing the ids of its available copies"""
+
+    noun = "titles with available copies"
+
+    def __init__(self):
+        super().__init__()
+        # Remembered for copies that are out on loan, so a return can be
+        # re-indexed without a reload
+        self.copy_to_book = {}
+        self.book_meta = {}
+
+    def _replace(self, fresh):
+        super()._replace(fresh)
+        self.copy_to_book = fresh.copy_to_book
+        self.book_meta = fresh.book_meta
+
+    def add_copy(self, row: dict):
+        self._journal_write("add_copy", row)
+        book_id, copy_id = str(row["book_id"]), str(row["copy_id"])
+        self.copy_to_book[copy_id] = book_id
+        self.book_meta[book_id] = {"title": row.get("title"), "author": row.get("author")}
+        record = self.records.get(book_id)
+        if record is None:
+            record = {"book_id": book_id, "title": row.get("title"), "author": row.get("author"), "copy_ids": []}
+            self.put(book_id, record, keys_for(row.get("title"), row.get("author")))
+        if copy_id not in record["copy_ids"]:
+            record["copy_ids"].append(copy_id)
+
+    def copy_issued(self, copy_id: str):
+        self._journal_write("copy_issued", copy_id)
+        book_id = self.copy_to_book.get(str(copy_id))
+        record = self.records.get(book_id)
+        if record is None:
+            return
+        if str(copy_id) in record["copy_ids"]:
+            record["copy_ids"].remove(str(copy_id))
+        if not record["copy_ids"]:
+            self._remove(book_id)
+
+    def copy_returned(self, copy_id: str):
+        # We only know the title if the copy was seen before; otherwise reload
+        book_id = self.copy_to_book.get(str(copy_id))
+        if book_id is None:
+            self.mark_stale()
+            return
+        self.add_copy({"book_id": book_id, "copy_id": copy_id, **self.book_meta[book_id]})
+
+    async def load(self, fresh):
+        cursor = None
+        while True:
+            # available_books_view has no created_at, so page on (title, copy_id)
+            page = await paginate(supabase.table("available_books_view").select("*"), "title", "copy_id", 1000, cursor)
+            for row in page["data"]:
+                fresh.add_copy(row)
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
+member_lookup = MemberLookup()
+copy_lookup = CopyLookup()
@@ -0,0 +1,95 @@
+import asyncio
+from collections import deque
+import orjson
+from fastapi.middleware.gzip import GZipMiddleware
+from app.config import SSE_QUEUE_SIZE, SSE_HISTORY, SSE_HEARTBEAT_SECONDS
+
+class EventBroker:
+    """In-process fan-out of small change events to Server-Sent Events streams.
+
+    publish() encodes an event once and drops the same bytes into every
+    subscriber's bounded queue without awaiting, so a write endpoint pays
+    the same whether ten or five hundred dashboards are open. A subscriber
+    that falls SSE_QUEUE_SIZE events behind loses its backlog and gets a
+    single `resync` instead, and recent events are kept so a reconnecting
+    client can resume from Last-Event-ID.
+    """
+
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE, history: int = SSE_HISTORY):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.history = deque(maxlen=history)  # (event id, frame)
+        self.last_id = 0
+        self.published = 0
+        self.overflows = 0
+
+    def publish(self, event: str, data: dict):
+        self.last_id += 1
+        frame = self._frame(event, data, self.last_id)
+        self.history.append((self.last_id, frame))
+        self.published += 1
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self.overflows += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._frame("resync", {"reason": "overflow"}))
+
+    @staticmethod
+    def _frame(event: str, data: dict, event_id: int = None) -> bytes:
+        head = f"id: {event_id}\n" if event_id is not None else ""
+        return f"{head}event: {event}\n".encode() + b"data: " + orjson.dumps(data) + b"\n\n"
+
+    def _replay(self, last_event_id: str) -> list:
+        try:
+            after = int(last_event_id)
+        except (TypeError, ValueError):
+            return []
+        if after >= self.last_id:
+            return []
+        if not self.history or self.history[0][0] > after + 1:
+            # Missed more than we remember
+            return [self._frame("resync", {"reason": "history"})]
+        return [frame for event_id, frame in self.history if event_id > after]
+
+    async def stream(self, last_event_id: str = None):
+        """Async generator of SSE frames for one subscriber, with heartbeats"""
+        queue = asyncio.Queue(self.queue_size)
+        # Registered and replayed in one step, so nothing lands in between
+        self.subscribers.add(queue)
+        backlog = self._replay(last_event_id)
+        try:
+            yield b"retry: 3000\n\n"
+            for frame in backlog:
+                yield frame
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line; keeps proxies from closing an idle stream
+                    yield b": ping\n\n"
+                    continue
+                yield frame
+        finally:
+            self.subscribers.discard(queue)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "events_published": self.published,
+            "last_event_id": self.last_id,
+            "overflows": self.overflows,
+        }
+
+broker = EventBroker()
+
+class EventStreamAwareGZipMiddleware(GZipMiddleware):
+    """GZip for everything but /events, whose frames must reach the browser as
+    they are published rather than when the compressor's buffer fills"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/events":
+            return await self.app(scope, receive, send)
+        await super().__call__(scope, receive, send)
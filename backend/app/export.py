@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+import zlib
+from app.database import supabase
+from app.pagination import paginate
+
+# table -> (sort column, id column) used to walk the table by keyset
+EXPORT_TABLES = {
+    "books": ("created_at", "id"),
+    "members": ("created_at", "id"),
+    "book_copies": ("id", "id"),
+    "transactions": ("issue_date", "id"),
+}
+
+EXPORT_PAGE_SIZE = 1000
+
+async def iter_rows(table: str, page_size: int = EXPORT_PAGE_SIZE):
+    """Yield pages of rows, holding at most one page in memory"""
+    sort_col, id_col = EXPORT_TABLES[table]
+    cursor = None
+    while True:
+        page = await paginate(supabase.table(table).select("*"), sort_col, id_col, page_size, cursor)
+        if page["data"]:
+            yield page["data"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+async def iter_ndjson(pages):
+    async for rows in pages:
+        yield "".join(json.dumps(row, default=str) + "\n" for row in rows).encode()
+
+async def iter_csv(pages):
+    columns = None
+    async for rows in pages:
+        buffer = io.StringIO()
+        first_page = columns is None
+        if first_page:
+            columns = list(rows[0].keys())
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        if first_page:
+            writer.writeheader()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+async def gzip_stream(chunks):
+    """Compress a byte stream on the fly (gzip container, wbits=31)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from app.resilience import detach_deadline
+
+MAX_JOBS = 100
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "pending"
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self._task = None
+
+    def progress(self, done: int, total: int = None):
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    async def wait(self):
+        """Wait for the job to finish without cancelling it if the waiter is"""
+        await asyncio.shield(self._task)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+# Most recent jobs, oldest dropped first once MAX_JOBS is reached
+jobs = OrderedDict()
+
+async def _run(job: Job, func):
+    detach_deadline()
+    job.status = "running"
+    try:
+        job.result = await func(job)
+        job.status = "completed"
+    except Exception as e:
+        logger.exception("Job %s (%s) failed: %s", job.name, job.id, e)
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.now().isoformat()
+
+def start_job(name: str, func) -> Job:
+    """Run `await func(job)` in the background and return the job handle at once"""
+    job = Job(name)
+    jobs[job.id] = job
+    while len(jobs) > MAX_JOBS:
+        jobs.popitem(last=False)
+    job._task = asyncio.create_task(_run(job, func))
+    return job
+
+def get_job(job_id: str):
+    return jobs.get(job_id)
@@ -1,43 +1,83 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.models import UserCreate, UserLogin, Token
-from app.auth import hash_password, verify_password, create_access_token, get_current_user, require_admin
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse, ORJSONResponse
+from app.models import UserCreate, UserLogin, Token, BatchCirculationRequest, LibraryPulseResponse
+from app.auth import hash_password, verify_password, needs_rehash, hash_pool_stats, create_access_token, get_current_user, require_admin
 from app.database import supabase
+from app.cache import TTLCache, cached, invalidate, response_cache
+from app.pagination import paginate_raw
+from app.responses import EnvelopeResponse
+from app.bulk_import import import_books
+from app.jobs import start_job, get_job, jobs
+from app.search import search_index
+from app.desk import member_lookup, copy_lookup
+from app.export import EXPORT_TABLES, iter_rows, iter_csv, iter_ndjson, gzip_stream
+from app.logging_setup import setup_logging
+from app.metrics import MetricsMiddleware, register_gauges, render_metrics
+from app.resilience import UpstreamError, DeadlineMiddleware, deadline_budget
+from app.ratelimit import RateLimitMiddleware, rate_limiter
+from app.conditional import ConditionalGetMiddleware
+from app.events import broker, EventStreamAwareGZipMiddleware
+from app.pulse import pulse
+from app.fines import overdue_report
+from app.recommend import co_borrow
+import asyncio
+import logging
 import time
+from datetime import datetime
 
-# Simple in-memory cache
-cache = {}
-CACHE_TTL = 300  # 5 minutes
-
-def get_cached(key):
-    if key in cache:
-        data, timestamp = cache[key]
-        if time.time() - timestamp < CACHE_TTL:
-            return data
-        else:
-            del cache[key]
-    return None
-
-def set_cached(key, data):
-    cache[key] = (data, time.time())
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Library Management API",
     description="RESTful API for Library Management System with JWT authentication",
-    version="1.0.0"
+    version="1.0.0",
+    # Endpoints that build their payload in Python still skip the stdlib encoder
+    default_response_class=ORJSONResponse,
 )
 
+# Added before CORS so it sits inside it and 429s still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After"],
 )
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Added before GZip so it sits inside it: ETags hash the plain body and a
+# 304 skips compression altogether
+app.add_middleware(ConditionalGetMiddleware)
+
+app.add_middleware(EventStreamAwareGZipMiddleware, minimum_size=1000)
+
+# Every request gets REQUEST_DEADLINE for its upstream calls unless the route overrides it
+app.add_middleware(DeadlineMiddleware)
+
+# Outermost, so timings include compression and CORS handling
+app.add_middleware(MetricsMiddleware)
+
+register_gauges("upstream_pool", supabase.pool_stats)
+register_gauges("response_cache", response_cache.stats)
+register_gauges("password_hash_pool", hash_pool_stats)
+register_gauges("search_index", search_index.stats)
+register_gauges("upstream_circuit", supabase.breaker.stats)
+register_gauges("rate_limit", rate_limiter.stats)
+register_gauges("events", broker.stats)
+register_gauges("pulse", pulse.stats)
+register_gauges("fines", overdue_report.stats)
+register_gauges("recommend", co_borrow.stats)
+
+@app.exception_handler(UpstreamError)
+async def upstream_error_handler(request, exc: UpstreamError):
+    """Database outages become 503/504 rather than empty results"""
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)}, headers=headers)
 
 # Serve static frontend files
 app.mount("/static", StaticFiles(directory="../frontend"), name="frontend")
@@ -47,15 +87,69 @@ async def read_root():
     from fastapi.responses import FileResponse
     return FileResponse("../frontend/index.html")
 
+# Shared upstream connection pool lives for the lifetime of the app
+@app.on_event("startup")
+async def open_http_pool():
+    await supabase.open()
+
+@app.on_event("shutdown")
+async def close_http_pool():
+    await supabase.close()
+
+# Catalog search index: built in the background, then periodically reconciled
+@app.on_event("startup")
+async def start_search_index():
+    search_index.start()
+
+@app.on_event("shutdown")
+async def stop_search_index():
+    search_index.stop()
+
+# Pulse counters: counted once, then kept current by deltas and reconciled
+@app.on_event("startup")
+async def start_pulse():
+    pulse.start()
+
+@app.on_event("shutdown")
+async def stop_pulse():
+    pulse.stop()
+
+# Overdue fines: batch job on a schedule, result kept in memory
+@app.on_event("startup")
+async def start_fines():
+    overdue_report.start()
+
+@app.on_event("shutdown")
+async def stop_fines():
+    overdue_report.stop()
+
+# Co-borrowing neighbours: built in the background, new loans folded in as they happen
+@app.on_event("startup")
+async def start_recommendations():
+    co_borrow.start()
+
+@app.on_event("shutdown")
+async def stop_recommendations():
+    co_borrow.stop()
+
+# Desk typeahead indexes load in the background
+@app.on_event("startup")
+async def load_desk_lookups():
+    member_lookup.mark_stale()
+    copy_lookup.mark_stale()
+
 # Create default admin on startup
 @app.on_event("startup")
 async def create_default_admin():
     admin_email = "admin@library.com"
-    existing = await supabase.table("users").select("*").eq("email", admin_email).execute()
-    if not existing.data:
-        hashed = hash_password("admin123")
-        await supabase.table("users").insert({"email": admin_email, "password_hash": hashed})
-        print(f"Created default admin: {admin_email} / admin123")
+    try:
+        existing = await supabase.table("users").select("*").eq("email", admin_email).execute()
+        if not existing.data:
+            hashed = await hash_password("admin123")
+            await supabase.table("users").insert({"email": admin_email, "password_hash": hashed})
+            logger.info("Created default admin: %s", admin_email)
+    except UpstreamError as e:
+        logger.warning("Could not check the default admin, database unavailable: %s", e)
 
 # Helper to check if user is admin (hardcoded admin email for now)
 ADMIN_EMAILS = ["admin@library.com"]
@@ -72,49 +166,92 @@ async def register(user: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user account
-    hashed = hash_password(user.password)
+    hashed = await hash_password(user.password)
     result = await supabase.table("users").insert({"email": user.email, "password_hash": hashed})
     if not result.data:
         raise HTTPException(status_code=500, detail="Failed to create user")
     
     # Also create member record so they appear in admin's member list
     member_name = user.full_name if user.full_name else user.email.split('@')[0]
-    await supabase.table("members").insert({
+    member = await supabase.table("members").insert({
         "email": user.email,
         "full_name": member_name,
         "phone": user.phone or "",
         "member_type": "Student"
     })
+    publish_members(member.data)
     
-    token = create_access_token(data={"sub": user.email, "role": "member"})
+    member_id = member.data[0]["id"] if member.data else None
+    token = create_access_token(data={"sub": user.email, "role": "member", "member_id": member_id})
     return {"access_token": token, "token_type": "bearer", "role": "member"}
 
 @app.post("/auth/login", response_model=Token, tags=["Auth"])
 async def login(user: UserLogin):
-    result = await supabase.table("users").select("*").eq("email", user.email).execute()
+    # Member id is fetched alongside the user so it can go into the token
+    result, member = await asyncio.gather(
+        supabase.table("users").select("*").eq("email", user.email).execute(),
+        supabase.table("members").select("id").eq("email", user.email).execute(),
+    )
     if not result.data:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     db_user = result.data[0]
-    if not verify_password(user.password, db_user["password_hash"]):
+    if not await verify_password(user.password, db_user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    # Transparently upgrade legacy SHA-256 (or lower-cost bcrypt) hashes
+    if needs_rehash(db_user["password_hash"]):
+        upgraded = await hash_password(user.password)
+        await supabase.table("users").eq("email", user.email).update({"password_hash": upgraded})
     role = "admin" if is_admin_email(user.email) else "member"
-    token = create_access_token(data={"sub": user.email, "role": role})
+    member_id = member.data[0]["id"] if member.data else None
+    token = create_access_token(data={"sub": user.email, "role": role, "member_id": member_id})
     return {"access_token": token, "token_type": "bearer", "role": role}
 
+# email -> member id for tokens without a member_id claim
+member_id_cache = TTLCache(maxsize=4096, ttl=300)
+
+async def resolve_member_id(user: dict):
+    """Member id from the token claim, falling back to a cached email lookup"""
+    if user.get("member_id"):
+        return user["member_id"]
+    member_id = member_id_cache.get(user["email"])
+    if member_id is None:
+        member = await supabase.table("members").select("id").eq("email", user["email"]).execute()
+        if not member.data:
+            return None
+        member_id = member.data[0]["id"]
+        member_id_cache.set(user["email"], member_id, tags=("members",))
+    return member_id
+
 @app.get("/auth/me", tags=["Auth"])
 async def get_me(user=Depends(get_current_user)):
     return user
 
 # ==================== ADMIN ONLY: BOOKS ====================
 @app.get("/books", tags=["Books (Admin)"])
-async def get_books(limit: int = 100, user=Depends(require_admin)):
-    result = await supabase.table("books").select("*").limit(limit).execute()
-    return {"data": result.data, "count": len(result.data)}
+@cached("books")
+async def get_books(limit: int = 100, cursor: str = None, include_total: bool = False, user=Depends(require_admin)):
+    query = supabase.table("books").select("*")
+    return await paginate_raw(query, "created_at", "id", limit, cursor, with_total=include_total)
 
 @app.get("/books/available", tags=["Books (Admin)"])
-async def get_available_books(limit: int = 100, user=Depends(require_admin)):
-    result = await supabase.table("available_books_view").select("*").limit(limit).execute()
-    return {"data": result.data, "count": len(result.data)}
+@cached("books", "book_copies")
+async def get_available_books(limit: int = 100, cursor: str = None, include_total: bool = False, user=Depends(require_admin)):
+    query = supabase.table("available_books_view").select("*")
+    return await paginate_raw(query, "title", "copy_id", limit, cursor, with_total=include_total)
+
+@app.get("/books/search", tags=["Books"])
+async def search_books(q: str = Query(..., min_length=1), limit: int = 10, user=Depends(get_current_user)):
+    """Ranked title/author/isbn search with prefix and typo-tolerant matching"""
+    started = time.perf_counter()
+    results = search_index.search(q, max(1, min(limit, 100)))
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+    return {"data": results, "count": len(results), "took_ms": took_ms}
+
+@app.get("/books/{book_id}/similar", tags=["Books"])
+async def get_similar_books(book_id: str, limit: int = 10, user=Depends(get_current_user)):
+    """Books most often borrowed by readers of this one"""
+    results = co_borrow.similar(book_id, max(1, min(limit, 50)))
+    return {"data": results, "count": len(results), "loaded": co_borrow.loaded}
 
 @app.post("/books", tags=["Books (Admin)"])
 async def add_book(book: dict, user=Depends(require_admin)):
@@ -137,29 +274,69 @@ async def add_book(book: dict, user=Depends(require_admin)):
         
         # Also create a book copy for the new book
         if result.data and len(result.data) > 0:
+            search_index.add(result.data[0])
             book_id = result.data[0].get("id")
+            copies = []
             if book_id:
-                await supabase.table("book_copies").insert({
+                copies = (await supabase.table("book_copies").insert({
                     "book_id": book_id,
                     "copy_number": 1,
                     "condition": "Good",
                     "is_available": True
-                })
+                })).data
+            for copy in copies:
+                copy_lookup.add_copy({"book_id": book_id, "copy_id": copy["id"],
+                                      "title": result.data[0].get("title"), "author": result.data[0].get("author")})
+            record_counters({"total_books": 1, "total_copies": len(copies), "available_copies": len(copies)})
+            pulse.bump(pulse.by_language, result.data[0].get("language"))
+            broker.publish("book", {"op": "insert", "row": result.data[0]})
         
+        invalidate("books", "book_copies")
         return {"message": "Book added successfully", "data": result.data}
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/books/bulk", tags=["Books (Admin)"], dependencies=[Depends(deadline_budget(None))])
+async def bulk_import_books(file: UploadFile = File(...), format: str = None, batch_size: int = 500,
+                            user=Depends(require_admin)):
+    """Import books from a CSV (header: title,author,isbn,language,copies) or NDJSON upload"""
+    fmt = format or ("ndjson" if (file.filename or "").endswith((".ndjson", ".jsonl")) else "csv")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    batch_size = max(1, min(batch_size, 1000))
+    summary = await import_books(file.file, fmt, batch_size)
+    if summary["books_created"]:
+        invalidate("books", "book_copies")
+        copy_lookup.mark_stale()
+        record_counters({"total_books": summary["books_created"],
+                         "total_copies": summary["copies_created"],
+                         "available_copies": summary["copies_created"]})
+        # Languages of the imported rows aren't tallied here
+        pulse.mark_stale()
+        # Too many rows to push; lists refetch
+        broker.publish("resync", {"tables": ["books"]})
+    return {"message": f"Imported {summary['books_created']} books", **summary}
+
 @app.delete("/books/{book_id}", tags=["Books (Admin)"])
 async def delete_book(book_id: str, user=Depends(require_admin)):
     result = await supabase.table("books").eq("id", book_id).delete()
+    invalidate("books", "book_copies")
+    search_index.remove(book_id)
+    copy_lookup.mark_stale()
+    if result.data:
+        broker.publish("book", {"op": "delete", "id": book_id})
+        # How many copies and loans went with it isn't known here
+        pulse.mark_stale()
+        broker.publish("resync", {"tables": ["book_copies", "transactions"]})
     return {"message": "Book deleted successfully", "data": result.data}
 
 # ==================== ADMIN ONLY: MEMBERS ====================
 @app.get("/members", tags=["Members (Admin)"])
-async def get_members(limit: int = 100, user=Depends(require_admin)):
-    result = await supabase.table("members").select("*").limit(limit).execute()
-    return {"data": result.data, "count": len(result.data)}
+async def get_members(limit: int = 100, cursor: str = None, include_total: bool = False, user=Depends(require_admin)):
+    query = supabase.table("members").select("*")
+    return await paginate_raw(query, "created_at", "id", limit, cursor, with_total=include_total)
 
 @app.post("/members", tags=["Members (Admin)"])
 async def add_member(member: dict, user=Depends(require_admin)):
@@ -169,194 +346,262 @@ async def add_member(member: dict, user=Depends(require_admin)):
         "phone": member.get("phone"),
         "member_type": member.get("member_type", "Student")
     })
+    publish_members(result.data)
     return {"message": "Member added successfully", "data": result.data}
 
 @app.delete("/members/{member_id}", tags=["Members (Admin)"])
 async def delete_member(member_id: str, user=Depends(require_admin)):
     result = await supabase.table("members").eq("id", member_id).delete()
+    invalidate("members")
+    member_id_cache.invalidate("members")
+    member_lookup.remove(member_id)
+    for row in result.data:
+        pulse.bump(pulse.by_member_type, row.get("member_type"), -1)
+    if result.data:
+        broker.publish("member", {"op": "delete", "id": member_id})
+        record_counters({"active_members": -len(result.data)})
     return {"message": "Member deleted successfully", "data": result.data}
 
 # ==================== ADMIN ONLY: TRANSACTIONS ====================
 @app.get("/transactions", tags=["Transactions (Admin)"])
-async def get_transactions(limit: int = 100, user=Depends(require_admin)):
-    result = await supabase.table("transactions").select("*").limit(limit).execute()
-    return {"data": result.data, "count": len(result.data)}
+async def get_transactions(limit: int = 100, cursor: str = None, include_total: bool = False, user=Depends(require_admin)):
+    query = supabase.table("transactions").select("*")
+    return await paginate_raw(query, "issue_date", "id", limit, cursor, desc=True, with_total=include_total)
 
 @app.get("/transactions/current", tags=["Transactions (Admin)"])
-async def get_current_transactions(limit: int = 100, user=Depends(require_admin)):
-    result = await supabase.table("current_transactions_view").select("*").limit(limit).execute()
-    return {"data": result.data, "count": len(result.data)}
+async def get_current_transactions(limit: int = 100, cursor: str = None, include_total: bool = False, user=Depends(require_admin)):
+    query = supabase.table("current_transactions_view").select("*")
+    return await paginate_raw(query, "issue_date", "transaction_id", limit, cursor, desc=True, with_total=include_total)
 
 @app.post("/transactions/issue", tags=["Transactions (Admin)"])
 async def issue_book(book_copy_id: str = Query(...), member_id: str = Query(...), user=Depends(require_admin)):
-    from datetime import datetime, timedelta
-    
-    # Check if book copy is available
-    copy_check = await supabase.table("book_copies").select("is_available").eq("id", book_copy_id).execute()
-    if not copy_check.data or not copy_check.data[0].get("is_available", False):
-        raise HTTPException(status_code=400, detail="Book copy is not available")
-    
-    member = await supabase.table("members").select("max_borrow_days").eq("id", member_id).execute()
-    max_days = member.data[0]["max_borrow_days"] if member.data and member.data[0].get("max_borrow_days") else 14
-    
-    result = await supabase.table("transactions").insert({
-        "book_copy_id": book_copy_id,
-        "member_id": member_id,
-        "issue_date": datetime.now().isoformat(),
-        "due_date": (datetime.now() + timedelta(days=max_days)).strftime("%Y-%m-%d")
-    })
-    
-    await supabase.table("book_copies").eq("id", book_copy_id).update({"is_available": False})
+    # Availability check, loan insert and copy update run atomically in the database
+    result = await supabase.rpc("issue_book", {"p_book_copy_id": book_copy_id, "p_member_id": member_id})
+    if result.error:
+        raise HTTPException(status_code=400, detail=result.error)
+    invalidate("transactions", "book_copies")
+    copy_lookup.copy_issued(book_copy_id)
+    publish_circulation("issue", result.data)
     return {"message": "Book issued successfully", "data": result.data}
 
 @app.post("/transactions/{transaction_id}/return", tags=["Transactions (Admin)"])
 async def return_book(transaction_id: str, user=Depends(require_admin)):
-    from datetime import datetime
-    txn = await supabase.table("transactions").select("book_copy_id").eq("id", transaction_id).execute()
-    await supabase.table("transactions").eq("id", transaction_id).update({"return_date": datetime.now().isoformat()})
-    if txn.data:
-        await supabase.table("book_copies").eq("id", txn.data[0]["book_copy_id"]).update({"is_available": True})
+    result = await supabase.rpc("return_book", {"p_transaction_id": transaction_id})
+    if result.error:
+        raise HTTPException(status_code=400, detail=result.error)
+    invalidate("transactions", "book_copies")
+    for txn in result.data:
+        copy_lookup.copy_returned(txn["book_copy_id"])
+    publish_circulation("return", result.data)
     return {"message": "Book returned successfully"}
 
-# ==================== MEMBER: MY BOOKS ====================
+@app.post("/transactions/batch", tags=["Transactions (Admin)"])
+async def batch_circulation(request: BatchCirculationRequest, user=Depends(require_admin)):
+    """Issue or return a stack of scanned copies in one round trip"""
+    if request.action not in ("issue", "return"):
+        raise HTTPException(status_code=400, detail="action must be issue or return")
+    if request.action == "issue" and not request.member_id:
+        raise HTTPException(status_code=400, detail="member_id is required to issue")
+    if not request.book_copy_ids:
+        return {"data": [], "succeeded": 0, "failed": 0}
+    result = await supabase.rpc("circulation_batch", {
+        "p_action": request.action,
+        "p_book_copy_ids": request.book_copy_ids,
+        "p_member_id": request.member_id,
+    })
+    if result.error:
+        raise HTTPException(status_code=400, detail=result.error)
+    succeeded = len([r for r in result.data if r.get("ok")])
+    if succeeded:
+        invalidate("transactions", "book_copies")
+    for r in result.data:
+        if r.get("ok"):
+            if request.action == "issue":
+                copy_lookup.copy_issued(r["book_copy_id"])
+            else:
+                copy_lookup.copy_returned(r["book_copy_id"])
+    publish_circulation(request.action, [r["transaction"] for r in result.data if r.get("ok")])
+    return {"data": result.data, "succeeded": succeeded, "failed": len(result.data) - succeeded}
+
+def loan_row(txn: dict, today: str) -> dict:
+    """A transactions row in current_transactions_view's shape, with the
+    title and member name taken from the desk lookups"""
+    book_id = copy_lookup.copy_to_book.get(str(txn.get("book_copy_id")))
+    member = member_lookup.records.get(str(txn.get("member_id"))) or {}
+    if txn.get("return_date"):
+        status = "Returned"
+    elif txn.get("due_date") and txn["due_date"] < today:
+        status = "Overdue"
+    else:
+        status = "Active"
+    return {
+        "transaction_id": txn.get("id"),
+        "book_title": (copy_lookup.book_meta.get(book_id) or {}).get("title"),
+        "member_name": member.get("full_name"),
+        "issue_date": txn.get("issue_date"),
+        "due_date": txn.get("due_date"),
+        "return_date": txn.get("return_date"),
+        "status": status,
+    }
+
+def record_counters(deltas: dict):
+    """Apply pulse counter deltas and push them to open dashboards"""
+    pulse.apply(deltas)
+    broker.publish("counters", deltas)
+
+def publish_circulation(action: str, txns: list):
+    """Push counter deltas and the touched loans for committed issues/returns"""
+    if not txns:
+        return
+    today = datetime.now().strftime("%Y-%m-%d")
+    sign = 1 if action == "issue" else -1
+    deltas = {"available_copies": -sign * len(txns), "issued_copies": sign * len(txns)}
+    if action == "return":
+        overdue = len([t for t in txns if t.get("due_date") and t["due_date"] < today])
+        if overdue:
+            deltas["overdue_count"] = -overdue
+    record_counters(deltas)
+    if action == "issue":
+        co_borrow.add_loans(txns)
+    broker.publish("transactions", {"rows": [loan_row(t, today) for t in txns]})
+
+def publish_members(rows: list):
+    """Count, index and push newly created members, whether an admin added
+    them or they registered themselves"""
+    invalidate("members")
+    for row in rows:
+        member_lookup.add_member(row)
+        pulse.bump(pulse.by_member_type, row.get("member_type"))
+        broker.publish("member", {"op": "insert", "row": row})
+    if rows:
+        record_counters({"active_members": len(rows)})
+
+# ==================== CIRCULATION DESK: TYPEAHEAD ====================
+@app.get("/desk/lookup/members", tags=["Circulation Desk (Admin)"])
+async def lookup_members(q: str = "", limit: int = 10, user=Depends(require_admin)):
+    """Members whose name, email or phone starts with the typed text"""
+    started = time.perf_counter()
+    results = member_lookup.lookup(q, max(1, min(limit, 50)))
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+    return {"data": results, "count": len(results), "loaded": member_lookup.loaded, "took_ms": took_ms}
+
+@app.get("/desk/lookup/copies", tags=["Circulation Desk (Admin)"])
+async def lookup_available_copies(q: str = "", limit: int = 10, user=Depends(require_admin)):
+    """Titles with available copies whose title or author starts with the typed text"""
+    started = time.perf_counter()
+    results = copy_lookup.lookup(q, max(1, min(limit, 50)))
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+    return {"data": results, "count": len(results), "loaded": copy_lookup.loaded, "took_ms": took_ms}
+
+# Transactions with their book embedded through book_copies -> books (one round trip)
+TXN_WITH_BOOK_SELECT = "id,book_copy_id,issue_date,due_date,return_date,book_copies(book_id,books(title,author))"
+
+async def attach_books(txns: list) -> list:
+    """Resolve the embedded book for each transaction.
+
+    Rows whose embed came back empty fall back to two batched in.() lookups
+    (copies, then books) instead of one pair of calls per transaction.
+    """
+    missing = [t for t in txns if not (t.get("book_copies") or {}).get("books")]
+    if missing:
+        copy_ids = list({t["book_copy_id"] for t in missing if t.get("book_copy_id")})
+        copies = await supabase.table("book_copies").select("id,book_id").in_("id", copy_ids).execute() if copy_ids else None
+        copy_to_book = {c["id"]: c["book_id"] for c in (copies.data if copies else [])}
+        book_ids = list(set(copy_to_book.values()))
+        books = await supabase.table("books").select("id,title,author").in_("id", book_ids).execute() if book_ids else None
+        books_by_id = {b["id"]: b for b in (books.data if books else [])}
+        for t in missing:
+            book = books_by_id.get(copy_to_book.get(t.get("book_copy_id")))
+            t["book_copies"] = {"book_id": book["id"], "books": book} if book else None
+    return [(t, t["book_copies"]["books"]) for t in txns if t.get("book_copies") and t["book_copies"].get("books")]
+
 @app.get("/my/books", tags=["Member Dashboard"])
 async def get_my_borrowed_books(user=Depends(get_current_user)):
     """Get books currently borrowed by logged-in member"""
-    # Find member by email
-    member = await supabase.table("members").select("id").eq("email", user["email"]).execute()
-    if not member.data:
+    member_id = await resolve_member_id(user)
+    if not member_id:
         return {"data": [], "message": "No member profile found for " + user["email"]}
     
-    member_id = member.data[0]["id"]
+    # Get active transactions (no return_date) for this member, with book info embedded
+    txns = await supabase.table("transactions").select(TXN_WITH_BOOK_SELECT).eq("member_id", member_id).is_("return_date", None).execute()
     
-    # Get active transactions (no return_date) for this member
-    txns = await supabase.table("transactions").select("*").eq("member_id", member_id).execute()
-    active_txns = [t for t in txns.data if not t.get("return_date")]
-    
-    # Enrich with book info
-    import asyncio
-    async def enrich_txn(txn):
-        book_copy = await supabase.table("book_copies").select("book_id").eq("id", txn["book_copy_id"]).execute()
-        if book_copy.data:
-            book = await supabase.table("books").select("title,author").eq("id", book_copy.data[0]["book_id"]).execute()
-            if book.data:
-                return {
-                    "transaction_id": txn["id"],
-                    "book_title": book.data[0]["title"],
-                    "author": book.data[0]["author"],
-                    "issue_date": txn["issue_date"],
-                    "due_date": txn["due_date"],
-                    "status": "Active"
-                }
-        return None
-    
-    tasks = [enrich_txn(txn) for txn in active_txns]
-    results = await asyncio.gather(*tasks)
-    result = [r for r in results if r]
+    result = [{
+        "transaction_id": txn["id"],
+        "book_title": book["title"],
+        "author": book["author"],
+        "issue_date": txn["issue_date"],
+        "due_date": txn["due_date"],
+        "status": "Active"
+    } for txn, book in await attach_books(txns.data)]
     
     return {"data": result, "count": len(result)}
 
 @app.get("/my/history", tags=["Member Dashboard"])
 async def get_my_history(user=Depends(get_current_user)):
     """Get borrowing history for logged-in member"""
-    member = await supabase.table("members").select("id").eq("email", user["email"]).execute()
-    if not member.data:
+    member_id = await resolve_member_id(user)
+    if not member_id:
         return {"data": [], "message": "No member profile found"}
     
-    member_id = member.data[0]["id"]
-    txns = await supabase.table("transactions").select("*").eq("member_id", member_id).execute()
+    txns = await supabase.table("transactions").select(TXN_WITH_BOOK_SELECT).eq("member_id", member_id).execute()
     
-    # Enrich with book info
-    import asyncio
-    async def enrich_txn_history(txn):
-        book_copy = await supabase.table("book_copies").select("book_id").eq("id", txn["book_copy_id"]).execute()
-        if book_copy.data:
-            book = await supabase.table("books").select("title,author").eq("id", book_copy.data[0]["book_id"]).execute()
-            if book.data:
-                status = "Returned" if txn.get("return_date") else "Active"
-                return {
-                    "transaction_id": txn["id"],
-                    "book_title": book.data[0]["title"],
-                    "author": book.data[0]["author"],
-                    "issue_date": txn["issue_date"],
-                    "due_date": txn["due_date"],
-                    "return_date": txn.get("return_date"),
-                    "status": status
-                }
-        return None
-    
-    tasks = [enrich_txn_history(txn) for txn in txns.data]
-    results = await asyncio.gather(*tasks)
-    result = [r for r in results if r]
+    result = [{
+        "transaction_id": txn["id"],
+        "book_title": book["title"],
+        "author": book["author"],
+        "issue_date": txn["issue_date"],
+        "due_date": txn["due_date"],
+        "return_date": txn.get("return_date"),
+        "status": "Returned" if txn.get("return_date") else "Active"
+    } for txn, book in await attach_books(txns.data)]
     
     return {"data": result, "count": len(result)}
 
+@app.get("/my/recommendations", tags=["Member Dashboard"])
+async def get_my_recommendations(limit: int = 10, user=Depends(get_current_user)):
+    """Books borrowed by readers with a similar history, popular titles as a fallback"""
+    member_id = await resolve_member_id(user)
+    limit = max(1, min(limit, 50))
+    results = co_borrow.recommend(member_id, limit) if member_id else co_borrow.popular(limit)
+    return {"data": results, "count": len(results), "loaded": co_borrow.loaded}
+
 # ==================== ANALYTICS (Admin) ====================
 @app.get("/analytics/subjects", tags=["Analytics (Admin)"])
+@cached("subjects", "books", "book_copies", "transactions")
 async def get_subject_performance(user=Depends(require_admin)):
-    result = await supabase.table("subject_performance_view").select("*").execute()
-    return {"data": result.data, "count": len(result.data)}
+    result = await supabase.table("subject_performance_view").select("*").execute(raw=True)
+    return EnvelopeResponse(result.body, count=result.rows)
 
 @app.get("/analytics/summary", tags=["Analytics (Admin)"])
 async def get_analytics_summary(user=Depends(require_admin)):
-    # Get real-time counts directly from tables
-    books = await supabase.table("books").select("id,language").execute()
-    members = await supabase.table("members").select("id,member_type").execute()
-    book_copies = await supabase.table("book_copies").select("id,is_available").execute()
-    transactions = await supabase.table("transactions").select("id,return_date,due_date").execute()
-    
-    # Debug logging
-    print(f"[Analytics] Books: {len(books.data)}, Members: {len(members.data)}, Copies: {len(book_copies.data)}, Txns: {len(transactions.data)}")
-    
-    # Calculate real metrics
-    total_books = len(books.data)
-    total_members = len(members.data)
-    total_copies = len(book_copies.data)
-    available_copies = len([c for c in book_copies.data if c.get("is_available", True)])
-    issued_copies = total_copies - available_copies
-    
-    # Count overdue (no return_date and due_date < today)
-    from datetime import datetime
-    today = datetime.now().strftime("%Y-%m-%d")
-    overdue_count = 0
-    for t in transactions.data:
-        if not t.get("return_date") and t.get("due_date"):
-            if t["due_date"] < today:
-                overdue_count += 1
-    
-    # Member type counts
-    type_counts = {}
-    for m in members.data:
-        t = m.get("member_type", "Unknown")
-        type_counts[t] = type_counts.get(t, 0) + 1
-    
-    # Language counts
-    lang_counts = {}
-    for b in books.data:
-        l = b.get("language", "Unknown")
-        lang_counts[l] = lang_counts.get(l, 0) + 1
-    
-    result = {
-        "pulse": {
-            "total_books": total_books,
-            "total_copies": total_copies,
-            "available_copies": available_copies,
-            "issued_copies": issued_copies,
-            "overdue_count": overdue_count,
-            "active_members": total_members
-        },
-        "total_books": total_books,
-        "total_members": total_members,
-        "by_member_type": type_counts,
-        "by_language": lang_counts
-    }
-    
-    return result
+    """Served from the in-memory pulse counters (see app/pulse.py)"""
+    await pulse.ensure_loaded()
+    if not pulse.loaded:
+        raise HTTPException(status_code=503, detail="Library pulse is not available yet")
+    return pulse.summary()
+
+@app.get("/analytics/pulse/history", tags=["Analytics (Admin)"])
+async def get_pulse_history(days: int = 30, user=Depends(require_admin)):
+    """Daily pulse snapshots, newest first"""
+    days = max(1, min(days, 366))
+    result = await supabase.table("library_pulse").select("*").order("snapshot_date", desc=True).limit(days).execute()
+    snapshots = [LibraryPulseResponse(**{**row, "id": str(row["id"]), "snapshot_date": str(row["snapshot_date"])})
+                 for row in result.data]
+    return {"data": snapshots, "count": len(snapshots)}
+
+@app.get("/analytics/overdue", tags=["Analytics (Admin)"])
+async def get_overdue(limit: int = 50, user=Depends(require_admin)):
+    """Overdue loans and fines from the last fines job (see app/fines.py)"""
+    if overdue_report.summary is None:
+        raise HTTPException(status_code=503, detail="Overdue report is not computed yet")
+    loans = overdue_report.loans[:max(0, limit)]
+    return {**overdue_report.summary, "data": loans, "count": len(loans)}
 
 @app.get("/subjects", tags=["Subjects"])
+@cached("subjects")
 async def get_subjects():
-    result = await supabase.table("subjects").select("*").execute()
-    return {"data": result.data, "count": len(result.data)}
+    result = await supabase.table("subjects").select("*").execute(raw=True)
+    return EnvelopeResponse(result.body, count=result.rows)
 
 @app.get("/", tags=["Root"])
 async def root():
@@ -366,52 +611,116 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
-@app.delete("/admin/clean-data", tags=["Admin"])
+@app.get("/metrics", tags=["Root"])
+async def metrics():
+    """Prometheus text exposition: route and upstream latency histograms plus pool gauges"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/events", tags=["Root"])
+async def events(last_event_id: str = Header(None), user=Depends(require_admin)):
+    """Server-Sent Events stream of dashboard deltas: `counters` (changes to the
+    summary pulse), `transactions`, `book` and `member` rows, and `resync`
+    when a client should refetch instead"""
+    return StreamingResponse(broker.stream(last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/admin/pool-stats", tags=["Admin"])
+async def get_pool_stats(user=Depends(require_admin)):
+    """Upstream connection pool utilisation"""
+    return supabase.pool_stats()
+
+@app.get("/admin/cache-stats", tags=["Admin"])
+async def get_cache_stats(user=Depends(require_admin)):
+    """Response cache hit/miss/eviction counters"""
+    return response_cache.stats()
+
+@app.get("/admin/hash-pool-stats", tags=["Admin"])
+async def get_hash_pool_stats(user=Depends(require_admin)):
+    return hash_pool_stats()
+
+@app.get("/admin/search-stats", tags=["Admin"])
+async def get_search_stats(user=Depends(require_admin)):
+    return search_index.stats()
+
+@app.get("/admin/export/{table}", tags=["Admin"], dependencies=[Depends(deadline_budget(None))])
+async def export_table(table: str, format: str = "csv", gzip: bool = False, user=Depends(require_admin)):
+    """Stream a full table dump as CSV or NDJSON, paging through PostgREST"""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown export table: {table}")
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    body = iter_csv(iter_rows(table)) if format == "csv" else iter_ndjson(iter_rows(table))
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"{table}.{format}"
+    if gzip:
+        body = gzip_stream(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+async def clean_data_job(job):
+    # Transactions reference copies and members, so they go first
+    job.progress(0, 4)
+    await supabase.table("transactions").neq("id", NIL_UUID).delete(returning="minimal")
+    job.progress(1)
+    await supabase.bulk_delete([
+        supabase.table("book_copies").neq("id", NIL_UUID),
+        supabase.table("members").neq("id", NIL_UUID),
+        supabase.table("users").neq("email", "admin@library.com"),
+    ])
+    job.progress(4)
+    invalidate("transactions", "book_copies", "members")
+    member_id_cache.invalidate("members")
+    member_lookup.mark_stale()
+    copy_lookup.mark_stale()
+    pulse.mark_stale()
+    broker.publish("resync", {"tables": ["transactions", "book_copies", "members"]})
+    return {"message": "Data cleaned successfully. Books preserved."}
+
+@app.delete("/admin/clean-data", tags=["Admin"], status_code=202)
 async def clean_data(user=Depends(require_admin)):
-    """Clean all data except books - removes members, transactions, book_copies, users (except admin)"""
-    try:
-        import httpx
-        from app.config import SUPABASE_URL, SUPABASE_ANON_KEY
-        headers = {
-            "apikey": SUPABASE_ANON_KEY,
-            "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
-            "Content-Type": "application/json",
-            "Prefer": "return=minimal"
-        }
-        
-        with httpx.Client(timeout=30.0) as client:
-            # Delete all transactions
-            client.delete(f"{SUPABASE_URL}/rest/v1/transactions?id=neq.00000000-0000-0000-0000-000000000000", headers=headers)
-            
-            # Delete all book_copies
-            client.delete(f"{SUPABASE_URL}/rest/v1/book_copies?id=neq.00000000-0000-0000-0000-000000000000", headers=headers)
-            
-            # Delete all members
-            client.delete(f"{SUPABASE_URL}/rest/v1/members?id=neq.00000000-0000-0000-0000-000000000000", headers=headers)
-            
-            # Delete non-admin users
-            client.delete(f"{SUPABASE_URL}/rest/v1/users?email=neq.admin@library.com", headers=headers)
-        
-        return {"message": "Data cleaned successfully. Books preserved."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/admin/init-book-copies", tags=["Admin"])
+    """Clean all data except books - removes members, transactions, book_copies, users (except admin).
+    Runs in the background, poll /admin/jobs/{job_id} for status."""
+    job = start_job("clean-data", clean_data_job)
+    return {"message": "Clean-up started", "job_id": job.id}
+
+async def init_book_copies_job(job):
+    orphans = await supabase.anti_join("books", "book_copies")
+    job.progress(0, len(orphans))
+    created = await supabase.bulk_insert("book_copies", [
+        {"book_id": book["id"], "copy_number": 1, "condition": "Good", "is_available": True}
+        for book in orphans
+    ], on_chunk=job.progress)
+    invalidate("book_copies")
+    copy_lookup.mark_stale()
+    if created:
+        record_counters({"total_copies": created, "available_copies": created})
+    return {"message": f"Created {created} book copies", "books_without_copies": len(orphans)}
+
+@app.post("/admin/init-book-copies", tags=["Admin"], status_code=202)
 async def init_book_copies(user=Depends(require_admin)):
-    """Create book copies for all books that don't have copies"""
-    try:
-        books = await supabase.table("books").select("id").execute()
-        created = 0
-        for book in books.data:
-            existing = await supabase.table("book_copies").select("id").eq("book_id", book["id"]).execute()
-            if not existing.data:
-                await supabase.table("book_copies").insert({
-                    "book_id": book["id"],
-                    "copy_number": 1,
-                    "condition": "Good",
-                    "is_available": True
-                })
-                created += 1
-        return {"message": f"Created {created} book copies", "total_books": len(books.data)}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """Create book copies for all books that don't have copies.
+    Runs in the background, poll /admin/jobs/{job_id} for status."""
+    job = start_job("init-book-copies", init_book_copies_job)
+    return {"message": "Book copy initialisation started", "job_id": job.id}
+
+@app.post("/admin/compute-fines", tags=["Admin"], status_code=202)
+async def compute_fines(user=Depends(require_admin)):
+    """Recompute overdue days and fines now instead of waiting for the schedule.
+    Runs in the background, poll /admin/jobs/{job_id} for status."""
+    job = overdue_report.run()
+    return {"message": "Fine computation started", "job_id": job.id}
+
+@app.get("/admin/jobs", tags=["Admin"])
+async def list_jobs(user=Depends(require_admin)):
+    return {"data": [job.to_dict() for job in reversed(jobs.values())]}
+
+@app.get("/admin/jobs/{job_id}", tags=["Admin"])
+async def get_job_status(job_id: str, user=Depends(require_admin)):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
@@ -0,0 +1,139 @@
+import bisect
+import contextvars
+import time
+
+# Seconds; covers cache hits through slow PostgREST scans
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Cumulative-bucket latency histogram per label set, Prometheus style"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels: tuple, seconds: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        i = bisect.bisect_left(self.buckets, seconds)
+        if i < len(self.buckets):
+            series[i] += 1
+        series[-2] += seconds
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {series[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels: tuple, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{label_text}}} {value}")
+        return lines
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ("method", "route", "status"))
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds", "PostgREST call latency by calling route, table and verb",
+    ("route", "table", "verb", "status"))
+upstream_errors = Counter(
+    "upstream_request_errors_total", "PostgREST calls that raised before a response",
+    ("table", "verb", "error"))
+
+# Extra gauges (name -> zero-arg callable returning a dict of stats), e.g. pool stats
+gauge_sources = {}
+
+def register_gauges(prefix: str, source):
+    gauge_sources[prefix] = source
+
+# The ASGI scope of the request being served, so upstream timings can be
+# attributed to the route that caused them
+current_scope = contextvars.ContextVar("current_scope", default=None)
+
+def current_route() -> str:
+    scope = current_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+VERBS = {"GET": "select", "HEAD": "count", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+def observe_upstream(method: str, url: str, seconds: float, status):
+    path = url.split("/rest/v1/", 1)[-1].split("?", 1)[0]
+    verb = "rpc" if path.startswith("rpc/") else VERBS.get(method, method.lower())
+    table = path[4:] if verb == "rpc" else path
+    upstream_request_duration.observe((current_route(), table, verb, str(status)), seconds)
+
+def observe_upstream_error(method: str, url: str, error: Exception):
+    path = url.split("/rest/v1/", 1)[-1].split("?", 1)[0]
+    upstream_errors.inc((path, VERBS.get(method, method.lower()), type(error).__name__))
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = current_scope.set(scope)
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe((scope["method"], route_path, str(status["code"])),
+                                          time.perf_counter() - started)
+            current_scope.reset(token)
+
+def render_metrics() -> str:
+    lines = []
+    for metric in (http_request_duration, upstream_request_duration, upstream_errors):
+        lines.extend(metric.render())
+    for prefix, source in gauge_sources.items():
+        for key, value in source().items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -56,12 +56,18 @@ class TransactionResponse(BaseModel):
     issue_date: datetime
     due_date: str
     return_date: Optional[datetime] = None
+    days_overdue: int = 0
     fine_amount: float = 0
 
 class IssueBookRequest(BaseModel):
     book_copy_id: str
     member_id: str
 
+class BatchCirculationRequest(BaseModel):
+    action: str  # "issue" or "return"
+    book_copy_ids: list[str]
+    member_id: Optional[str] = None  # required for "issue"
+
 # Analytics Models
 class LibraryPulseResponse(BaseModel):
     id: str
@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import json
+import orjson
+from fastapi import HTTPException
+from app.storage import TableQuery, quote_value
+from app.responses import EnvelopeResponse
+
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(sort_value, row_id) -> str:
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def paginate(query: TableQuery, sort_col: str, id_col: str = "id", limit: int = 100,
+                   cursor: str = None, desc: bool = False, with_total: bool = False) -> dict:
+    """Keyset pagination over (sort_col, id_col).
+
+    Returns the usual {"data", "count"} envelope plus "next_cursor" (None on
+    the last page) and, when requested, "total". Ordering is stable because
+    id_col breaks ties, and each page costs the same however deep it is.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    page = _keyset(query, sort_col, id_col, cursor, desc)
+    # One extra row tells us whether another page exists
+    if with_total:
+        result, total = await asyncio.gather(
+            page.limit(limit + 1).execute(),
+            query.select(query._select_cols, count="exact", head=True).execute(),
+        )
+    else:
+        result, total = await page.limit(limit + 1).execute(), None
+    rows = result.data[:limit]
+    next_cursor = None
+    if len(result.data) > limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.get(sort_col), last.get(id_col))
+    envelope = {"data": rows, "count": len(rows), "next_cursor": next_cursor}
+    if with_total:
+        envelope["total"] = total.count
+    return envelope
+
+async def paginate_raw(query: TableQuery, sort_col: str, id_col: str = "id", limit: int = 100,
+                       cursor: str = None, desc: bool = False, with_total: bool = False) -> EnvelopeResponse:
+    """paginate() for endpoints that return rows untouched: the page is passed
+    through as PostgREST's bytes and only its last row is decoded for the cursor.
+    The look-ahead row is cut off the bytes the same way.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # One extra row tells us whether another page exists
+    page = _keyset(query, sort_col, id_col, cursor, desc).limit(limit + 1)
+    if with_total:
+        result, total = await asyncio.gather(
+            page.execute(raw=True),
+            query.select(query._select_cols, count="exact", head=True).execute(),
+        )
+    else:
+        result, total = await page.execute(raw=True), None
+    body, rows = result.body, result.rows
+    next_cursor = None
+    if rows > limit:
+        body, rows = without_last_row(body), limit
+        last = last_row(body)
+        next_cursor = encode_cursor(last.get(sort_col), last.get(id_col))
+    meta = {"count": rows, "next_cursor": next_cursor}
+    if with_total:
+        meta["total"] = total.count
+    return EnvelopeResponse(body, **meta)
+
+def _keyset(query: TableQuery, sort_col: str, id_col: str, cursor: str, desc: bool) -> TableQuery:
+    page = query.order(sort_col, desc=desc).order(id_col, desc=desc)
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        op = "lt" if desc else "gt"
+        sort_value, row_id = quote_value(sort_value), quote_value(row_id)
+        page = page.or_(f"{sort_col}.{op}.{sort_value},and({sort_col}.eq.{sort_value},{id_col}.{op}.{row_id})")
+    return page
+
+def last_row(body: bytes) -> dict:
+    """Decode only the final element of a PostgREST JSON array.
+
+    Postgres' json_agg puts a newline between elements and a JSON string
+    can't hold a raw newline, so the last row starts after the last one. If
+    that slice isn't a whole object (say the row embeds its own array) the
+    body is decoded in full instead.
+    """
+    end = body.rstrip()[:-1]
+    start = end.rfind(b"\n")
+    if start != -1:
+        try:
+            row = orjson.loads(end[start + 1:])
+            if isinstance(row, dict):
+                return row
+        except orjson.JSONDecodeError:
+            pass
+    return orjson.loads(body)[-1]
+
+def without_last_row(body: bytes) -> bytes:
+    """The JSON array minus its final element, cut at the same newline
+    last_row() uses; re-encoded in full if the tail isn't a whole row"""
+    end = body.rstrip()[:-1]
+    start = end.rfind(b"\n")
+    if start != -1:
+        try:
+            if isinstance(orjson.loads(end[start + 1:]), dict):
+                head = end[:start].rstrip()
+                if head.endswith(b","):
+                    return head[:-1] + b"]"
+        except orjson.JSONDecodeError:
+            pass
+    return orjson.dumps(orjson.loads(body)[:-1])
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from datetime import date
+from app.config import PULSE_RECONCILE_SECONDS
+from app.database import supabase
+from app.resilience import detach_deadline
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("total_books", "total_copies", "available_copies", "issued_copies", "overdue_count", "active_members")
+# Deltas arriving mid-count may or may not be in the fresh numbers; after this
+# many skipped rounds the fresh counts win regardless
+MAX_SKIPPED_RECONCILES = 3
+
+class PulseEngine:
+    """Library pulse counters held in memory.
+
+    Counted from the database once at startup, then moved by O(1) deltas from
+    the write endpoints. A background loop recounts every
+    PULSE_RECONCILE_SECONDS to correct drift (direct database edits, loans
+    turning overdue overnight) and upserts today's row in library_pulse, which
+    builds up the daily history.
+    """
+
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.by_language = {}
+        self.by_member_type = {}
+        self.loaded = False
+        self.reconciled_at = None
+        self.last_drift = {}
+        self._generation = 0
+        self._skipped = 0
+        self._task = None
+        self._refresh_task = None
+
+    # ---- Deltas ----
+    def apply(self, deltas: dict):
+        for key, delta in deltas.items():
+            self.counters[key] = self.counters.get(key, 0) + delta
+        self._generation += 1
+
+    def bump(self, grouping: dict, key: str, delta: int = 1):
+        """Adjust a by_language / by_member_type bucket"""
+        key = key or "Unknown"
+        grouping[key] = grouping.get(key, 0) + delta
+        if grouping[key] <= 0:
+            del grouping[key]
+        self._generation += 1
+
+    # ---- Reconciliation ----
+    async def count(self) -> tuple:
+        """Fresh counters and groupings from HEAD counts and the aggregate views"""
+        today = date.today().isoformat()
+        books, members, copies, available, overdue, by_language, by_member_type = await asyncio.gather(
+            supabase.table("books").select("id", count="exact", head=True).execute(),
+            supabase.table("members").select("id", count="exact", head=True).execute(),
+            supabase.table("book_copies").select("id", count="exact", head=True).execute(),
+            supabase.table("book_copies").select("id", count="exact", head=True).eq("is_available", True).execute(),
+            # Overdue = not returned and due_date < today
+            supabase.table("transactions").select("id", count="exact", head=True).is_("return_date", None).lt("due_date", today).execute(),
+            supabase.table("books_by_language_view").select("language,count").execute(),
+            supabase.table("members_by_type_view").select("member_type,count").execute(),
+        )
+        counters = {
+            "total_books": books.count,
+            "total_copies": copies.count,
+            "available_copies": available.count,
+            "issued_copies": copies.count - available.count,
+            "overdue_count": overdue.count,
+            "active_members": members.count,
+        }
+        languages = {r.get("language") or "Unknown": r["count"] for r in by_language.data}
+        member_types = {r.get("member_type") or "Unknown": r["count"] for r in by_member_type.data}
+        return counters, languages, member_types
+
+    async def reconcile(self):
+        generation = self._generation
+        counters, languages, member_types = await self.count()
+        if self.loaded and self._generation != generation and self._skipped < MAX_SKIPPED_RECONCILES:
+            self._skipped += 1
+            logger.debug("Pulse reconcile skipped, writes landed while counting")
+            return
+        self._skipped = 0
+        if self.loaded:
+            self.last_drift = {k: counters[k] - self.counters.get(k, 0) for k in COUNTERS if counters[k] != self.counters.get(k, 0)}
+            if self.last_drift:
+                logger.info("Pulse drift corrected: %s", self.last_drift)
+        self.counters, self.by_language, self.by_member_type = counters, languages, member_types
+        self.loaded = True
+        self.reconciled_at = time.time()
+        await self.snapshot()
+
+    async def snapshot(self):
+        """Upsert today's library_pulse row with the current counters"""
+        await supabase.table("library_pulse").insert(
+            {"snapshot_date": date.today().isoformat(), **self.counters}, on_conflict="snapshot_date")
+
+    def mark_stale(self):
+        """Recount soon, for writes whose effect on the counters isn't known"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._safe_reconcile())
+
+    async def _safe_reconcile(self):
+        detach_deadline()
+        try:
+            await self.reconcile()
+        except Exception as e:
+            logger.exception("Pulse reconcile failed: %s", e)
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            self.mark_stale()
+            await asyncio.shield(self._refresh_task)
+
+    async def _reconcile_forever(self, interval: float):
+        while True:
+            # Through mark_stale, so a request waiting in ensure_loaded shares the run
+            self.mark_stale()
+            await asyncio.shield(self._refresh_task)
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = PULSE_RECONCILE_SECONDS):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._reconcile_forever(interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ---- Reads ----
+    def summary(self) -> dict:
+        return {
+            "pulse": dict(self.counters),
+            "total_books": self.counters["total_books"],
+            "total_members": self.counters["active_members"],
+            "by_member_type": dict(self.by_member_type),
+            "by_language": dict(self.by_language),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "reconciled_at": self.reconciled_at,
+            "last_drift_total": sum(abs(v) for v in self.last_drift.values()),
+            "skipped_reconciles": self._skipped,
+        }
+
+pulse = PulseEngine()
@@ -0,0 +1,149 @@
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from app.config import (
+    JWT_SECRET_KEY, JWT_ALGORITHM, RATE_LIMIT_ENABLED, RATE_LIMITS, RATE_LIMIT_MAX_KEYS, TRUSTED_PROXIES,
+)
+
+# Path prefix -> route group; None means the path is never limited
+ROUTE_GROUPS = (
+    ("/static/", None),
+    ("/health", None),
+    ("/metrics", None),
+    ("/auth/", "auth"),
+    ("/analytics/", "analytics"),
+    ("/desk/", "desk"),
+    ("/admin/", "admin"),
+)
+DEFAULT_GROUP = "api"
+
+def parse_limits(spec: str) -> dict:
+    """'auth=20/60,api=240/60' -> {'auth': (20, 60.0), 'api': (240, 60.0)}"""
+    limits = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        group, rule = part.split("=", 1)
+        requests, seconds = rule.split("/", 1)
+        limits[group.strip()] = (int(requests), float(seconds))
+    limits.setdefault(DEFAULT_GROUP, (240, 60.0))
+    return limits
+
+def route_group(path: str):
+    if path == "/":
+        return None
+    for prefix, group in ROUTE_GROUPS:
+        if path.startswith(prefix):
+            return group
+    return DEFAULT_GROUP
+
+def parse_proxies(spec: str):
+    """'10.0.0.0/8,127.0.0.1' -> list of networks; '*' -> None, any peer"""
+    if spec.strip() == "*":
+        return None
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+def is_trusted(address: str, proxies) -> bool:
+    if proxies is None:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+TRUSTED_NETWORKS = parse_proxies(TRUSTED_PROXIES)
+
+def client_ip(scope, headers: dict, proxies=TRUSTED_NETWORKS) -> str:
+    """The caller's address. Behind a proxy the socket peer is the proxy, so
+    for a trusted peer X-Forwarded-For is read from the right (the end our
+    proxies append to) up to the first hop that is not a trusted proxy. With
+    "*" only the right-most hop is used; earlier ones are client-supplied."""
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not is_trusted(address, proxies):
+        return address
+    forwarded = headers.get(b"x-forwarded-for", b"").decode("latin-1")
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    while hops:
+        address = hops.pop()
+        if proxies is None or not is_trusted(address, proxies):
+            break
+    return address
+
+def client_key(scope) -> str:
+    """Signed-in users are limited per account, everyone else per IP"""
+    headers = dict(scope.get("headers") or [])
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if authorization.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(authorization[7:], JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+            if payload.get("sub"):
+                return f"user:{payload['sub']}"
+        except JWTError:
+            pass
+    return f"ip:{client_ip(scope, headers)}"
+
+class RateLimiter:
+    """Token buckets per (route group, client): a group allowing N requests per
+    S seconds holds N tokens and refills at N/S per second, so short bursts
+    pass and sustained floods are cut to the configured rate.
+
+    Buckets are kept in LRU order and capped at `max_keys`; an evicted client
+    simply starts again with a full bucket.
+    """
+
+    def __init__(self, limits: dict, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.limits = limits
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # (group, client) -> (tokens, updated)
+        self.allowed = 0
+        self.limited = 0
+
+    def take(self, group: str, client: str) -> float:
+        """Spend a token; returns 0 if allowed, else seconds until one is available"""
+        capacity, window = self.limits.get(group) or self.limits[DEFAULT_GROUP]
+        rate = capacity / window
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop((group, client), (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+            self.allowed += 1
+        else:
+            wait = (1 - tokens) / rate
+            self.limited += 1
+        self.buckets[(group, client)] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {"tracked_clients": len(self.buckets), "allowed_total": self.allowed, "limited_total": self.limited}
+
+rate_limiter = RateLimiter(parse_limits(RATE_LIMITS))
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After once a client's bucket is empty"""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.limiter = limiter
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        group = route_group(scope["path"])
+        if group is None:
+            return await self.app(scope, receive, send)
+        wait = self.limiter.take(group, client_key(scope))
+        if wait:
+            response = JSONResponse(status_code=429, content={"detail": "Too many requests, slow down"},
+                                    headers={"Retry-After": str(math.ceil(wait))})
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import time
+import numpy as np
+from app.config import RECOMMEND_NEIGHBOURS, RECOMMEND_REBUILD_SECONDS
+from app.desk import copy_lookup
+from app.export import iter_rows
+from app.resilience import detach_deadline
+from app.search import search_index
+
+logger = logging.getLogger(__name__)
+
+# What rebuilds and loan fold-ins swap in; copy_to_book is kept separately
+# because add_loans() writes to the live one
+INDEX_FIELDS = ("book_ids", "book_index", "member_index", "_members", "_books", "member_ptr",
+                "book_ptr", "book_members", "degree", "neighbours", "scores")
+
+def gather(ptr: np.ndarray, values: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Concatenate the CSR slices values[ptr[r]:ptr[r + 1]] for every r in rows"""
+    starts, lengths = ptr[rows], ptr[rows + 1] - ptr[rows]
+    total = int(lengths.sum())
+    if not total:
+        return values[:0]
+    # Position i of slice j is starts[j] + i; build all of them without a Python loop
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return values[offsets]
+
+class CoBorrowIndex:
+    """Co-borrowing ("readers also borrowed") similarity over the loan history.
+
+    Loans form a sparse binary member x book matrix, kept as sorted
+    (member, book) pair arrays with CSR views both ways. Each book's
+    neighbours are the books its borrowers also borrowed, scored by cosine
+    similarity (co-borrowers / sqrt(borrowers_a * borrowers_b)), and only
+    the top RECOMMEND_NEIGHBOURS are kept in fixed-width int32/float32
+    arrays. New loans are applied in the background, recomputing just the
+    rows they affect; the whole index is rebuilt every
+    RECOMMEND_REBUILD_SECONDS.
+    """
+
+    def __init__(self, k: int = RECOMMEND_NEIGHBOURS):
+        self.k = k
+        self.book_ids = []       # row -> book id
+        self.book_index = {}     # book id -> row
+        self.member_index = {}   # member id -> row
+        self.copy_to_book = {}
+        self._members = np.zeros(0, np.int32)   # (member, book) pairs, deduplicated,
+        self._books = np.zeros(0, np.int32)     # sorted member-major
+        self.member_ptr = np.zeros(1, np.int64)
+        self.book_ptr = np.zeros(1, np.int64)
+        self.book_members = np.zeros(0, np.int32)
+        self.degree = np.zeros(0, np.int64)     # distinct borrowers per book
+        self.neighbours = np.full((0, k), -1, np.int32)
+        self.scores = np.zeros((0, k), np.float32)
+        self.loaded = False
+        self.built_at = None
+        self.build_seconds = None
+        self._rebuilding = False
+        self._pending = []
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._refresh_task = None
+
+    # ---- Structure ----
+    def _row(self, mapping: dict, key: str, ids: list = None) -> int:
+        row = mapping.get(key)
+        if row is None:
+            row = mapping[key] = len(mapping)
+            if ids is not None:
+                ids.append(key)
+        return row
+
+    def _pair_keys(self, members, books) -> np.ndarray:
+        """(member, book) as one int64 per pair; sorting keys sorts member-major"""
+        return np.asarray(members, np.int64) * max(len(self.book_ids), 1) + np.asarray(books, np.int64)
+
+    def _set_pairs(self, members: np.ndarray, books: np.ndarray):
+        keys = np.sort(self._pair_keys(members, books))
+        self._set_keys(keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys)
+
+    def _set_keys(self, keys: np.ndarray):
+        """Install sorted, distinct pair keys and derive the CSR views"""
+        n_books = len(self.book_ids)
+        self._members = (keys // max(n_books, 1)).astype(np.int32)
+        self._books = (keys % max(n_books, 1)).astype(np.int32)
+        self.member_ptr = np.searchsorted(self._members, np.arange(len(self.member_index) + 1)).astype(np.int64)
+        order = np.argsort(self._books, kind="stable")
+        self.book_members = self._members[order]
+        self.book_ptr = np.searchsorted(self._books[order], np.arange(n_books + 1)).astype(np.int64)
+        self.degree = np.diff(self.book_ptr)
+        grow = n_books - len(self.neighbours)
+        if grow > 0:
+            self.neighbours = np.vstack([self.neighbours, np.full((grow, self.k), -1, np.int32)])
+            self.scores = np.vstack([self.scores, np.zeros((grow, self.k), np.float32)])
+
+    def _co_borrowed(self, row: int) -> np.ndarray:
+        """Every book borrowed by someone who borrowed `row`, once per such borrower"""
+        borrowers = self.book_members[self.book_ptr[row]:self.book_ptr[row + 1]]
+        return gather(self.member_ptr, self._books, borrowers)
+
+    def _score_rows(self, rows):
+        for row in rows:
+            self.neighbours[row] = -1
+            self.scores[row] = 0
+            others, co = np.unique(self._co_borrowed(row), return_counts=True)
+            keep = others != row
+            others, co = others[keep], co[keep]
+            if not len(others):
+                continue
+            similarity = co / np.sqrt(self.degree[row] * self.degree[others])
+            if len(others) > self.k:
+                top = np.argpartition(-similarity, self.k)[:self.k]
+                others, similarity = others[top], similarity[top]
+            order = np.argsort(-similarity, kind="stable")
+            self.neighbours[row, :len(order)] = others[order]
+            self.scores[row, :len(order)] = similarity[order]
+
+    def _score_all(self, members: np.ndarray, books: np.ndarray):
+        self._set_pairs(members, books)
+        self._score_rows(range(len(self.book_ids)))
+
+    # ---- Maintenance ----
+    def _snapshot(self):
+        """Copy of the index that a worker thread can update while queries
+        keep reading this one. The pair and CSR arrays are only ever replaced,
+        never written in place, so they are shared; the neighbour table is
+        rescored in place and is copied."""
+        work = CoBorrowIndex(self.k)
+        for name in INDEX_FIELDS:
+            setattr(work, name, getattr(self, name))
+        work.book_ids = list(self.book_ids)
+        work.book_index = dict(self.book_index)
+        work.member_index = dict(self.member_index)
+        work.neighbours = self.neighbours.copy()
+        work.scores = self.scores.copy()
+        return work
+
+    def _swap(self, other):
+        # No await in between, so queries never see a half-swapped index
+        for name in INDEX_FIELDS:
+            setattr(self, name, getattr(other, name))
+
+    async def rebuild(self):
+        """Reload copies and loans and swap in a freshly scored index.
+
+        Scoring runs on a worker thread and the result is swapped in on the
+        event loop, so queries see either the old index or the new one.
+        Loans recorded while the reload runs are applied on top afterwards.
+        """
+        started = time.perf_counter()
+        fresh = CoBorrowIndex(self.k)
+        self._rebuilding = True
+        try:
+            async for rows in iter_rows("book_copies"):
+                for copy in rows:
+                    fresh.copy_to_book[str(copy["id"])] = str(copy["book_id"])
+            members, books = [], []
+            async for rows in iter_rows("transactions"):
+                for txn in rows:
+                    book_id = fresh.copy_to_book.get(str(txn.get("book_copy_id")))
+                    if book_id is None or not txn.get("member_id"):
+                        continue
+                    members.append(fresh._row(fresh.member_index, str(txn["member_id"])))
+                    books.append(fresh._row(fresh.book_index, book_id, fresh.book_ids))
+            await asyncio.get_running_loop().run_in_executor(
+                None, fresh._score_all, np.array(members, np.int32), np.array(books, np.int32))
+            # Wait out a fold-in that started before the reload
+            async with self._lock:
+                self._swap(fresh)
+                self.copy_to_book = fresh.copy_to_book
+        finally:
+            self._rebuilding = False
+        self.loaded = True
+        self.built_at = time.time()
+        self.build_seconds = round(time.perf_counter() - started, 3)
+        logger.info("Scored %d books from %d loans in %ss", len(self.book_ids), len(self._members), self.build_seconds)
+        await self.apply_pending()
+
+    def add_loans(self, txns: list):
+        """Queue newly issued loans; they are folded in by a background refresh"""
+        for txn in txns:
+            copy_id = str(txn.get("book_copy_id"))
+            book_id = self.copy_to_book.get(copy_id) or copy_lookup.copy_to_book.get(copy_id)
+            if book_id and txn.get("member_id"):
+                self.copy_to_book[copy_id] = book_id
+                self._pending.append((str(txn["member_id"]), book_id))
+        if self._pending:
+            self.mark_stale()
+
+    def _fold(self, pending: list):
+        """Add (member id, book id) loans to this index and rescore only the
+        books they touch: the borrowed book and everything co-borrowed with
+        it. Returns (loans added, books rescored)."""
+        members = [self._row(self.member_index, member_id) for member_id, _ in pending]
+        books = [self._row(self.book_index, book_id, self.book_ids) for _, book_id in pending]
+        # Existing keys are re-encoded for the current book count, which keeps
+        # them sorted, and the new ones are merged in; re-borrows are dropped
+        keys = self._pair_keys(self._members, self._books)
+        added = np.unique(self._pair_keys(members, books))
+        at = np.searchsorted(keys, added)
+        known = at < len(keys)
+        known[known] = keys[at[known]] == added[known]
+        added, at = added[~known], at[~known]
+        if not len(added):
+            return 0, 0
+        self._set_keys(np.insert(keys, at, added))
+        touched = set((added % max(len(self.book_ids), 1)).tolist())
+        dirty = set(touched)
+        for book in touched:
+            dirty.update(self._co_borrowed(book).tolist())
+        self._score_rows(sorted(dirty))
+        return len(added), len(dirty)
+
+    def _folded(self, pending: list):
+        work = self._snapshot()
+        return work, work._fold(pending)
+
+    async def apply_pending(self):
+        """Fold queued loans into a copy on a worker thread and swap it in;
+        loans queued meanwhile are folded in by the next round"""
+        async with self._lock:
+            while self._pending and self.loaded and not self._rebuilding:
+                pending, self._pending = self._pending, []
+                work, (added, rescored) = await asyncio.get_running_loop().run_in_executor(
+                    None, self._folded, pending)
+                if added:
+                    self._swap(work)
+                    logger.debug("Applied %d loans, rescored %d books", added, rescored)
+
+    def mark_stale(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._safe_refresh())
+
+    async def _safe_refresh(self):
+        detach_deadline()
+        try:
+            await self.apply_pending()
+        except Exception as e:
+            logger.exception("Applying loans failed: %s", e)
+
+    async def _reconcile_forever(self, interval: float):
+        while True:
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.exception("Rebuild failed: %s", e)
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = RECOMMEND_REBUILD_SECONDS):
+        """Build in the background at startup, then rebuild every `interval` seconds"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._reconcile_forever(interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ---- Querying ----
+    def _describe(self, rows, scores, reason: str, limit: int) -> list:
+        """Book fields from the search index; books deleted since the build are skipped"""
+        results = []
+        for row, score in zip(rows, scores):
+            book = search_index.docs.get(self.book_ids[row])
+            if book is not None:
+                results.append({**book, "score": round(float(score), 4), "reason": reason})
+                if len(results) == limit:
+                    break
+        return results
+
+    def popular(self, limit: int = 10, exclude=()) -> list:
+        rows = np.argsort(-self.degree, kind="stable")
+        rows = rows[~np.isin(rows, np.asarray(exclude, np.int64))] if len(exclude) else rows
+        return self._describe(rows[:limit * 2], self.degree[rows[:limit * 2]], "popular", limit)
+
+    def similar(self, book_id: str, limit: int = 10) -> list:
+        row = self.book_index.get(str(book_id))
+        if row is None:
+            return []
+        found = self.neighbours[row] >= 0
+        return self._describe(self.neighbours[row][found], self.scores[row][found], "co-borrowed", limit)
+
+    def recommend(self, member_id: str, limit: int = 10) -> list:
+        """Neighbours of the member's books, summed per candidate and minus
+        what they already borrowed; popular books fill any remaining slots"""
+        row = self.member_index.get(str(member_id))
+        borrowed = np.zeros(0, np.int32)
+        if row is not None and row + 1 < len(self.member_ptr):
+            borrowed = self._books[self.member_ptr[row]:self.member_ptr[row + 1]]
+        results = []
+        if len(borrowed):
+            candidates = self.neighbours[borrowed].ravel()
+            weights = self.scores[borrowed].ravel()
+            keep = (candidates >= 0) & ~np.isin(candidates, borrowed)
+            books, index = np.unique(candidates[keep], return_inverse=True)
+            totals = np.bincount(index, weights=weights[keep], minlength=len(books))
+            order = np.argsort(-totals, kind="stable")[:limit * 2]
+            results = self._describe(books[order], totals[order], "co-borrowed", limit)
+        if len(results) < limit:
+            seen = {r["id"] for r in results}
+            for book in self.popular(limit, exclude=borrowed):
+                if book["id"] not in seen and len(results) < limit:
+                    results.append(book)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "books": len(self.book_ids),
+            "members": len(self.member_index),
+            "loans": len(self._members),
+            "pending": len(self._pending),
+            "built_at": self.built_at,
+            "build_seconds": self.build_seconds,
+        }
+
+co_borrow = CoBorrowIndex()
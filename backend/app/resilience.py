@@ -0,0 +1,141 @@
+import contextvars
+import math
+import random
+import time
+from collections import deque
+from app.config import (
+    REQUEST_DEADLINE, RETRY_BACKOFF, RETRY_BACKOFF_MAX,
+    CIRCUIT_WINDOW, CIRCUIT_MIN_CALLS, CIRCUIT_FAILURE_RATIO, CIRCUIT_RESET_SECONDS,
+)
+
+class UpstreamError(Exception):
+    """The database could not answer; mapped to an HTTP error by the app"""
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: int = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UpstreamUnavailable(UpstreamError):
+    status_code = 503
+
+class UpstreamTimeout(UpstreamError):
+    status_code = 504
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+class UpstreamOverloaded(UpstreamUnavailable):
+    """Shed before queueing: too many calls already waiting for an upstream slot"""
+
+# ---- Deadlines ----
+# Absolute time.monotonic() by which the current request must be answered;
+# every upstream call gets at most the time that is left
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+def set_deadline(seconds: float = None):
+    """Give the rest of the current request `seconds` (None = no overall deadline)"""
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+def remaining_budget() -> float:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def deadline_budget(seconds: float = None):
+    """Route dependency overriding the default budget, e.g. for streaming exports"""
+    async def dependency():
+        set_deadline(seconds)
+    return dependency
+
+def detach_deadline():
+    """Background tasks copy the spawning request's context; drop its deadline"""
+    _deadline.set(None)
+
+class DeadlineMiddleware:
+    """ASGI middleware starting the REQUEST_DEADLINE budget for each HTTP request"""
+
+    def __init__(self, app, seconds: float = REQUEST_DEADLINE):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _deadline.set(time.monotonic() + self.seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
+
+# ---- Retries ----
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, so retrying workers don't line up"""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+# ---- Circuit breaker ----
+class CircuitBreaker:
+    """Fails fast once the recent upstream error rate crosses a threshold.
+
+    Closed: calls go through and outcomes are kept in a rolling window.
+    Open: calls are rejected with CircuitOpen until `reset_seconds` pass.
+    Half-open: a single probe call decides whether to close or re-open.
+    """
+
+    def __init__(self, window: int = CIRCUIT_WINDOW, min_calls: int = CIRCUIT_MIN_CALLS,
+                 failure_ratio: float = CIRCUIT_FAILURE_RATIO, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.outcomes = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.opened_at = None
+        self._probe_started = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        now = time.monotonic()
+        if self.state == "open":
+            wait = self.opened_at + self.reset_seconds - now
+            if wait > 0:
+                self.rejected += 1
+                raise CircuitOpen("Database temporarily unavailable", retry_after=math.ceil(wait))
+            self.state = "half_open"
+            self._probe_started = None
+        if self.state == "half_open":
+            # A probe that never reported back (cancelled) doesn't block forever
+            if self._probe_started is not None and now - self._probe_started < self.reset_seconds:
+                self.rejected += 1
+                raise CircuitOpen("Database temporarily unavailable", retry_after=1)
+            self._probe_started = now
+
+    def record(self, ok: bool):
+        if self.state == "half_open":
+            self._probe_started = None
+            if ok:
+                self.state = "closed"
+                self.outcomes.clear()
+            else:
+                self._open()
+            return
+        self.outcomes.append(ok)
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_ratio:
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        self.times_opened += 1
+
+    def stats(self) -> dict:
+        failures = self.outcomes.count(False)
+        return {
+            "state": self.state,
+            "open": self.state == "open",
+            "window_calls": len(self.outcomes),
+            "window_failures": failures,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected,
+        }
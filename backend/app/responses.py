@@ -0,0 +1,14 @@
+import orjson
+from fastapi.responses import Response
+
+def envelope_bytes(rows: bytes, **meta) -> bytes:
+    """b'{"data":<rows>,"count":...}' without decoding `rows`"""
+    return b'{"data":' + rows + (b"," if meta else b"") + orjson.dumps(meta)[1:]
+
+class EnvelopeResponse(Response):
+    """The usual {"data", "count", ...} envelope with PostgREST's JSON bytes
+    spliced in as "data", so large pages are never decoded and re-encoded"""
+    media_type = "application/json"
+
+    def __init__(self, rows: bytes, status_code: int = 200, headers: dict = None, **meta):
+        super().__init__(content=envelope_bytes(rows, **meta), status_code=status_code, headers=headers)
@@ -0,0 +1,223 @@
+import asyncio
+import bisect
+import logging
+import math
+import re
+import time
+from app.config import SEARCH_RECONCILE_SECONDS
+from app.export import iter_rows
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Title matches count double relative to author/isbn
+FIELD_WEIGHTS = {"title": 2, "author": 1, "isbn": 1}
+STORED_FIELDS = ("id", "title", "author", "isbn", "language")
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+FUZZY_MIN_SIMILARITY = 0.4
+MAX_EXPANSIONS = 50
+
+logger = logging.getLogger(__name__)
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall((text or "").lower())
+
+def trigrams(term: str) -> set:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    """In-memory inverted index over book title/author/isbn with BM25 ranking.
+
+    Query terms match exactly, by prefix (so typeahead works on partial
+    words) and, when neither hits, by trigram similarity for typos.
+    """
+
+    def __init__(self):
+        self._reset()
+        self.built_at = None
+        self.build_seconds = None
+        self._rebuilding = False
+        self._journal = []
+        self._task = None
+
+    def _reset(self):
+        self.docs = {}        # book_id -> stored fields
+        self.doc_terms = {}   # book_id -> {term: weighted tf}
+        self.doc_len = {}
+        self.total_len = 0
+        self.postings = {}    # term -> {book_id: weighted tf}
+        self.vocab = []       # sorted terms, for prefix lookups
+        self.grams = {}       # trigram -> set of terms
+
+    # ---- Maintenance ----
+    def add(self, book: dict):
+        if self._rebuilding:
+            self._journal.append(("add", book))
+        self._add(book)
+
+    def remove(self, book_id: str):
+        if self._rebuilding:
+            self._journal.append(("remove", book_id))
+        self._remove(book_id)
+
+    def _add(self, book: dict, index_vocab: bool = True):
+        """index_vocab=False leaves self.vocab alone; a full build sorts it
+        once at the end instead of inserting every new term"""
+        book_id = str(book.get("id"))
+        if book_id in self.docs:
+            self._remove(book_id)
+        terms = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            value = book.get(field) or ""
+            tokens = [value.replace("-", "").lower()] if field == "isbn" and value else tokenize(value)
+            for token in tokens:
+                terms[token] = terms.get(token, 0) + weight
+        self.docs[book_id] = {f: book.get(f) for f in STORED_FIELDS}
+        self.doc_terms[book_id] = terms
+        length = sum(terms.values())
+        self.doc_len[book_id] = length
+        self.total_len += length
+        for term, tf in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                if index_vocab:
+                    bisect.insort(self.vocab, term)
+                for gram in trigrams(term):
+                    self.grams.setdefault(gram, set()).add(term)
+            posting[book_id] = tf
+
+    def _remove(self, book_id: str):
+        book_id = str(book_id)
+        terms = self.doc_terms.pop(book_id, None)
+        if terms is None:
+            return
+        self.docs.pop(book_id, None)
+        self.total_len -= self.doc_len.pop(book_id, 0)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(book_id, None)
+            if not posting:
+                del self.postings[term]
+                i = bisect.bisect_left(self.vocab, term)
+                if i < len(self.vocab) and self.vocab[i] == term:
+                    self.vocab.pop(i)
+                for gram in trigrams(term):
+                    terms_for_gram = self.grams.get(gram)
+                    if terms_for_gram:
+                        terms_for_gram.discard(term)
+                        if not terms_for_gram:
+                            del self.grams[gram]
+
+    async def rebuild(self):
+        """Reload every book from the database and swap the index in.
+
+        Writes that land while the reload is running are journaled and
+        replayed on top, so they are not lost by the swap.
+        """
+        started = time.perf_counter()
+        fresh = SearchIndex()
+        self._rebuilding = True
+        self._journal = []
+        try:
+            async for rows in iter_rows("books"):
+                for book in rows:
+                    fresh._add(book, index_vocab=False)
+            fresh.vocab = sorted(fresh.postings)
+            for op, arg in self._journal:
+                if op == "add":
+                    fresh._add(arg)
+                else:
+                    fresh._remove(arg)
+        finally:
+            self._rebuilding = False
+            self._journal = []
+        (self.docs, self.doc_terms, self.doc_len, self.total_len,
+         self.postings, self.vocab, self.grams) = (
+            fresh.docs, fresh.doc_terms, fresh.doc_len, fresh.total_len,
+            fresh.postings, fresh.vocab, fresh.grams)
+        self.built_at = time.time()
+        self.build_seconds = round(time.perf_counter() - started, 3)
+        logger.info("Indexed %d books in %ss", len(self.docs), self.build_seconds)
+
+    async def _reconcile_forever(self, interval: float):
+        while True:
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.exception("Rebuild failed: %s", e)
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = SEARCH_RECONCILE_SECONDS):
+        """Build in the background at startup, then reconcile every `interval` seconds"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._reconcile_forever(interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ---- Querying ----
+    def _expand(self, token: str) -> dict:
+        """Index terms a query token may stand for, with a match weight"""
+        matches = {}
+        if token in self.postings:
+            matches[token] = 1.0
+        i = bisect.bisect_left(self.vocab, token)
+        while i < len(self.vocab) and self.vocab[i].startswith(token) and len(matches) < MAX_EXPANSIONS:
+            matches.setdefault(self.vocab[i], PREFIX_WEIGHT)
+            i += 1
+        if not matches and len(token) >= 3:
+            query_grams = trigrams(token)
+            shared = {}
+            for gram in query_grams:
+                for term in self.grams.get(gram, ()):
+                    shared[term] = shared.get(term, 0) + 1
+            scored = []
+            for term, count in shared.items():
+                similarity = count / (len(query_grams) + len(trigrams(term)) - count)
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    scored.append((similarity, term))
+            for similarity, term in sorted(scored, reverse=True)[:10]:
+                matches[term] = FUZZY_WEIGHT * similarity
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> list:
+        tokens = tokenize(query)
+        if not tokens or not self.docs:
+            return []
+        n_docs = len(self.docs)
+        avg_len = self.total_len / n_docs
+        scores = {}
+        for token in dict.fromkeys(tokens):
+            # Best-matching expansion per document, so "har" doesn't add up
+            # harry + harper + hart for the same book
+            best = {}
+            for term, weight in self._expand(token).items():
+                posting = self.postings[term]
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for book_id, tf in posting.items():
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[book_id] / avg_len)
+                    score = weight * idf * tf * (BM25_K1 + 1) / norm
+                    if score > best.get(book_id, 0):
+                        best[book_id] = score
+            for book_id, score in best.items():
+                scores[book_id] = scores.get(book_id, 0) + score
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{**self.docs[book_id], "score": round(score, 4)} for book_id, score in top]
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self.docs),
+            "terms": len(self.postings),
+            "trigrams": len(self.grams),
+            "built_at": self.built_at,
+            "build_seconds": self.build_seconds,
+        }
+
+search_index = SearchIndex()
@@ -0,0 +1,613 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from app.config import HTTP_TIMEOUT
+from app.resilience import CircuitBreaker, UpstreamTimeout, UpstreamUnavailable, remaining_budget
+from app.storage import Storage, TableQuery, RawResponse, SupabaseResponse
+
+logger = logging.getLogger(__name__)
+
+UUID_DEFAULT = ("(lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2)"
+                " || '-' || substr('89ab', 1 + abs(random()) % 4, 1) || substr(hex(randomblob(2)), 2)"
+                " || '-' || hex(randomblob(6))))")
+NOW = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"
+NOW_DEFAULT = f"({NOW})"
+
+# db/setup_database.sql in SQLite terms: UUIDs and timestamps are ISO text,
+# BOOLEAN columns hold 0/1 and are turned back into true/false on the way out
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY DEFAULT {UUID_DEFAULT},
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TEXT DEFAULT {NOW_DEFAULT}
+);
+
+CREATE TABLE IF NOT EXISTS members (
+    id TEXT PRIMARY KEY DEFAULT {UUID_DEFAULT},
+    full_name TEXT NOT NULL,
+    email TEXT UNIQUE,
+    phone TEXT,
+    member_type TEXT DEFAULT 'Student',
+    max_borrow_days INT DEFAULT 14,
+    created_at TEXT DEFAULT {NOW_DEFAULT}
+);
+
+CREATE TABLE IF NOT EXISTS books (
+    id TEXT PRIMARY KEY DEFAULT {UUID_DEFAULT},
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    isbn TEXT,
+    language TEXT DEFAULT 'English',
+    created_at TEXT DEFAULT {NOW_DEFAULT}
+);
+
+-- condition is written by add_book and init-book-copies
+CREATE TABLE IF NOT EXISTS book_copies (
+    id TEXT PRIMARY KEY DEFAULT {UUID_DEFAULT},
+    book_id TEXT REFERENCES books(id) ON DELETE CASCADE,
+    copy_number INT DEFAULT 1,
+    condition TEXT DEFAULT 'Good',
+    is_available BOOLEAN DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY DEFAULT {UUID_DEFAULT},
+    book_copy_id TEXT REFERENCES book_copies(id),
+    member_id TEXT REFERENCES members(id),
+    issue_date TEXT DEFAULT {NOW_DEFAULT},
+    due_date TEXT NOT NULL,
+    return_date TEXT,
+    days_overdue INT DEFAULT 0,
+    fine_amount REAL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_open_due ON transactions (due_date, id) WHERE return_date IS NULL;
+-- Postgres leaves foreign keys unindexed, but here every embed and anti-join
+-- resolves through them
+CREATE INDEX IF NOT EXISTS idx_book_copies_book ON book_copies (book_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_member ON transactions (member_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_copy ON transactions (book_copy_id);
+
+CREATE TABLE IF NOT EXISTS library_pulse (
+    id TEXT PRIMARY KEY DEFAULT {UUID_DEFAULT},
+    snapshot_date TEXT UNIQUE NOT NULL,
+    total_books INT DEFAULT 0,
+    total_copies INT DEFAULT 0,
+    available_copies INT DEFAULT 0,
+    issued_copies INT DEFAULT 0,
+    overdue_count INT DEFAULT 0,
+    active_members INT DEFAULT 0,
+    created_at TEXT DEFAULT {NOW_DEFAULT}
+);
+
+CREATE VIEW IF NOT EXISTS available_books_view AS
+SELECT b.id as book_id, b.title, b.author, bc.id as copy_id
+FROM books b
+JOIN book_copies bc ON b.id = bc.book_id
+WHERE bc.is_available = 1;
+
+CREATE VIEW IF NOT EXISTS current_transactions_view AS
+SELECT
+    t.id as transaction_id,
+    b.title as book_title,
+    m.full_name as member_name,
+    t.issue_date,
+    t.due_date,
+    t.return_date,
+    CASE
+        WHEN t.return_date IS NOT NULL THEN 'Returned'
+        WHEN t.due_date < date('now') THEN 'Overdue'
+        ELSE 'Active'
+    END as status
+FROM transactions t
+LEFT JOIN book_copies bc ON t.book_copy_id = bc.id
+LEFT JOIN books b ON bc.book_id = b.id
+LEFT JOIN members m ON t.member_id = m.id
+ORDER BY t.issue_date DESC;
+
+CREATE VIEW IF NOT EXISTS books_by_language_view AS
+SELECT COALESCE(language, 'Unknown') as language, COUNT(*) as count
+FROM books
+GROUP BY COALESCE(language, 'Unknown');
+
+CREATE VIEW IF NOT EXISTS members_by_type_view AS
+SELECT COALESCE(member_type, 'Unknown') as member_type, COUNT(*) as count
+FROM members
+GROUP BY COALESCE(member_type, 'Unknown');
+"""
+
+IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+COMPARISONS = {"eq": "=", "neq": "<>", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+# Errors that say the database is unusable right now, rather than that the
+# query was wrong; these surface as 503 like an unreachable PostgREST
+TRANSIENT_ERRORS = ("locked", "busy", "disk i/o", "unable to open", "readonly")
+# How often (in SQLite VM instructions) a running statement checks its deadline
+PROGRESS_STEPS = 10000
+
+class RpcError(Exception):
+    """RAISE EXCEPTION from a circulation function"""
+
+def ident(name: str) -> str:
+    if not IDENT_RE.match(name):
+        raise ValueError(f"Invalid identifier: {name!r}")
+    return f'"{name}"'
+
+def split_top(text: str) -> list:
+    """Split on commas outside parentheses and double quotes"""
+    parts, depth, quoted, start, i = [], 0, False, 0, 0
+    while i < len(text):
+        ch = text[i]
+        if quoted:
+            if ch == "\\":
+                i += 1
+            elif ch == '"':
+                quoted = False
+        elif ch == '"':
+            quoted = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return [p for p in parts if p]
+
+def unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r"\1", value[1:-1])
+    return value
+
+def parse_select(columns: str):
+    """'id,book_copies(book_id,books(title))' -> (['id'], {'book_copies': (['book_id'], {'books': ...})})"""
+    plain, embeds = [], {}
+    for part in split_top(columns.replace(" ", "")):
+        if "(" in part and part.endswith(")"):
+            name, inner = part[:-1].split("(", 1)
+            embeds[name] = parse_select(inner) if inner else None
+        else:
+            plain.append(part)
+    return plain, embeds
+
+class SQLiteStorage(Storage):
+    """Storage in a local SQLite file, for running the API offline, in tests
+    or under a benchmark harness.
+
+    Queries are the same PostgREST-style TableQuery the Supabase backend
+    sends, compiled to parameterised SQL (which sqlite3 keeps prepared in its
+    statement cache). The circulation functions are ported to Python and run
+    in one SQLite transaction each. All work happens on a single worker
+    thread that owns the connection, so the event loop never blocks on disk
+    and writes are serialised; WAL mode lets other processes read meanwhile.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.breaker = CircuitBreaker()
+        self._conn = None
+        self._executor = None
+        self._ready = None
+        self._deadline = None
+        self.relations = {}     # table or view -> column names
+        self.bool_columns = {}  # table or view -> BOOLEAN column names
+        self.foreign_keys = {}  # table -> [(column, referenced table, referenced column)]
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._queries_total = 0
+        self._interrupted_total = 0
+
+    # ---- Lifecycle ----
+    async def open(self):
+        """Open the connection on the worker thread and apply the schema"""
+        if self._ready is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+            self._ready = asyncio.get_running_loop().run_in_executor(self._executor, self._connect)
+        await self._ready
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(SCHEMA)
+        conn.set_progress_handler(self._check_deadline, PROGRESS_STEPS)
+        names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")]
+        for name in names:
+            info = conn.execute(f"PRAGMA table_info({ident(name)})").fetchall()
+            self.relations[name] = [r[1] for r in info]
+            self.bool_columns[name] = {r[1] for r in info if (r[2] or "").upper() == "BOOLEAN"}
+            self.foreign_keys[name] = [(r[3], r[2], r[4] or "id")
+                                       for r in conn.execute(f"PRAGMA foreign_key_list({ident(name)})")]
+        self._conn = conn
+        logger.info("Opened SQLite storage at %s (%d tables and views)", self.path, len(names))
+
+    async def close(self):
+        if self._ready is None:
+            return
+        executor, self._ready, self._executor = self._executor, None, None
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(executor, self._conn.close)
+            self._conn = None
+        executor.shutdown(wait=False)
+
+    def _check_deadline(self) -> int:
+        # Non-zero aborts the running statement with "interrupted"
+        return 1 if self._deadline is not None and time.monotonic() > self._deadline else 0
+
+    async def run(self, func, *args, timeout: float = None):
+        """Run func(conn, *args) on the worker thread within the request deadline"""
+        await self.open()
+        budget = remaining_budget()
+        if budget is not None and budget <= 0:
+            raise UpstreamTimeout("Request deadline exceeded before the database answered")
+        limit = min(t for t in (timeout or HTTP_TIMEOUT, budget) if t is not None)
+        self.breaker.before_call()
+        self._in_flight += 1
+        self._queries_total += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, self._call, func, args, limit)
+        except sqlite3.OperationalError as e:
+            self.breaker.record(False)
+            if "interrupted" in str(e):
+                self._interrupted_total += 1
+                raise UpstreamTimeout("Database query exceeded the request deadline")
+            raise UpstreamUnavailable(f"Database unavailable ({e})")
+        else:
+            self.breaker.record(True)
+            return result
+        finally:
+            self._in_flight -= 1
+
+    def _call(self, func, args, limit: float):
+        self._deadline = time.monotonic() + limit
+        try:
+            return func(self._conn, *args)
+        finally:
+            self._deadline = None
+            if self._conn.in_transaction:
+                self._conn.rollback()
+
+    def pool_stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "in_flight_requests": self._in_flight,
+            "peak_in_flight_requests": self._peak_in_flight,
+            "requests_total": self._queries_total,
+            "interrupted_total": self._interrupted_total,
+            "circuit": self.breaker.stats(),
+        }
+
+    def table(self, name: str):
+        return SQLiteTable(self, name)
+
+    # ---- Rows ----
+    def to_dicts(self, relation: str, cursor) -> list:
+        names = [d[0] for d in cursor.description]
+        rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        for column in self.bool_columns.get(relation, ()):
+            for row in rows:
+                if row.get(column) is not None:
+                    row[column] = bool(row[column])
+        return rows
+
+    # ---- Circulation functions (ports of db/circulation_functions.sql) ----
+    async def rpc(self, function: str, params: dict = None):
+        handler = RPC_FUNCTIONS.get(function)
+        if handler is None:
+            logger.warning("RPC %s error: no such function", function)
+            return SupabaseResponse([], error=f"RPC {function} failed")
+        return await self.run(self._rpc, handler, params or {})
+
+    def _rpc(self, conn, handler, params: dict):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            data = handler(self, conn, **params)
+        except (RpcError, sqlite3.IntegrityError) as e:
+            conn.rollback()
+            return SupabaseResponse([], error=str(e))
+        conn.commit()
+        return SupabaseResponse(data)
+
+def _issue_book(store, conn, p_book_copy_id, p_member_id):
+    member = conn.execute("SELECT COALESCE(max_borrow_days, 14) FROM members WHERE id = ?", (p_member_id,)).fetchone()
+    if member is None:
+        raise RpcError("Member not found")
+    claimed = conn.execute("UPDATE book_copies SET is_available = 0 WHERE id = ? AND is_available = 1", (p_book_copy_id,))
+    if claimed.rowcount == 0:
+        raise RpcError("Book copy is not available")
+    cursor = conn.execute(
+        f"INSERT INTO transactions (book_copy_id, member_id, issue_date, due_date) "
+        f"VALUES (?, ?, {NOW}, date('now', '+' || ? || ' days')) RETURNING *",
+        (p_book_copy_id, p_member_id, member[0]))
+    return store.to_dicts("transactions", cursor)
+
+def _return_book(store, conn, p_transaction_id):
+    cursor = conn.execute(
+        f"UPDATE transactions SET return_date = {NOW} WHERE id = ? AND return_date IS NULL RETURNING *",
+        (p_transaction_id,))
+    txns = store.to_dicts("transactions", cursor)
+    if not txns:
+        raise RpcError("Transaction not found or already returned")
+    conn.execute("UPDATE book_copies SET is_available = 1 WHERE id = ?", (txns[0]["book_copy_id"],))
+    return txns
+
+def _return_book_copy(store, conn, p_book_copy_id):
+    txn = conn.execute(
+        "SELECT id FROM transactions WHERE book_copy_id = ? AND return_date IS NULL ORDER BY issue_date DESC LIMIT 1",
+        (p_book_copy_id,)).fetchone()
+    if txn is None:
+        raise RpcError("No active loan for this copy")
+    return _return_book(store, conn, txn[0])
+
+def _circulation_batch(store, conn, p_action, p_book_copy_ids, p_member_id=None):
+    if p_action not in ("issue", "return"):
+        raise RpcError(f"Unknown action: {p_action}")
+    results = []
+    for copy_id in p_book_copy_ids:
+        # One savepoint per copy, so one failure does not undo the others
+        conn.execute("SAVEPOINT copy")
+        try:
+            if p_action == "issue":
+                txns = _issue_book(store, conn, copy_id, p_member_id)
+            else:
+                txns = _return_book_copy(store, conn, copy_id)
+        except (RpcError, sqlite3.IntegrityError) as e:
+            conn.execute("ROLLBACK TO copy")
+            results.append({"book_copy_id": copy_id, "ok": False, "error": str(e)})
+        else:
+            results.append({"book_copy_id": copy_id, "ok": True, "transaction": txns[0]})
+        conn.execute("RELEASE copy")
+    return results
+
+RPC_FUNCTIONS = {
+    "issue_book": _issue_book,
+    "return_book": _return_book,
+    "return_book_copy": _return_book_copy,
+    "circulation_batch": _circulation_batch,
+}
+
+class SQLiteTable(TableQuery):
+    """TableQuery compiled to SQL for SQLiteStorage"""
+
+    def __init__(self, store: SQLiteStorage, table: str):
+        super().__init__(table)
+        self.store = store
+        self._embed_names = set()
+
+    # ---- Compiling filters ----
+    def _value(self, column: str, value: str):
+        if value in ("true", "false") and column in self.store.bool_columns.get(self.table_name, ()):
+            return 1 if value == "true" else 0
+        return value
+
+    def _condition(self, column: str, expression: str, params: list, quoted: bool = False) -> str:
+        """One PostgREST filter, e.g. ('due_date', 'lt.2024-01-01'), as SQL"""
+        if column in ("or", "and"):
+            return self._logic(column, expression, params)
+        op, _, value = expression.partition(".")
+        if op == "not":
+            return f"NOT ({self._condition(column, value, params, quoted)})"
+        if column in self._embed_names:
+            return self._embed_condition(column, op, value)
+        if quoted:
+            value = unquote(value)
+        name = f"t.{ident(column)}"
+        if op in COMPARISONS:
+            params.append(self._value(column, value))
+            return f"{name} {COMPARISONS[op]} ?"
+        if op == "is":
+            keyword = {"null": "NULL", "true": "1", "false": "0", "unknown": "NULL"}[value.lower()]
+            return f"{name} IS {keyword}"
+        if op == "in":
+            items = [self._value(column, unquote(v)) for v in split_top(value[1:-1])]
+            params.extend(items)
+            return f"{name} IN ({', '.join('?' * len(items))})" if items else "0"
+        if op == "like":
+            # GLOB, because SQLite's LIKE ignores case
+            params.append(value.replace("[", "[[]").replace("?", "[?]").replace("%", "*").replace("_", "?"))
+            return f"{name} GLOB ?"
+        if op == "ilike":
+            params.append(value.replace("*", "%"))
+            return f"{name} LIKE ?"
+        raise ValueError(f"Unsupported filter operator: {op}")
+
+    def _logic(self, kind: str, expression: str, params: list) -> str:
+        """or=(a.eq.1,and(b.gt.2,c.is.null)) and its nested forms"""
+        terms = []
+        for part in split_top(expression[1:-1]):
+            if part.startswith(("or(", "and(")):
+                nested, inner = part.split("(", 1)
+                terms.append(self._logic(nested, "(" + inner, params))
+            else:
+                column, _, rest = part.partition(".")
+                terms.append(self._condition(column, rest, params, quoted=True))
+        joiner = " OR " if kind == "or" else " AND "
+        return "(" + joiner.join(terms) + ")"
+
+    def _relation(self, related: str):
+        """(local column, related column, many) linking this table to `related`"""
+        for column, ref_table, ref_column in self.store.foreign_keys.get(self.table_name, ()):
+            if ref_table == related:
+                return column, ref_column, False
+        for column, ref_table, ref_column in self.store.foreign_keys.get(related, ()):
+            if ref_table == self.table_name:
+                return ref_column, column, True
+        raise ValueError(f"No relationship between {self.table_name} and {related}")
+
+    def _embed_condition(self, related: str, op: str, value: str) -> str:
+        """related=is.null / not.is.null: rows with no (or some) related rows"""
+        if op != "is" or value != "null":
+            raise ValueError(f"Unsupported filter on embedded {related}: {op}.{value}")
+        local, remote, _ = self._relation(related)
+        return (f"NOT EXISTS (SELECT 1 FROM {ident(related)} r "
+                f"WHERE r.{ident(remote)} = t.{ident(local)})")
+
+    def _where(self, params: list, embed_names=None) -> str:
+        self._embed_names = set(parse_select(self._select_cols)[1]) if embed_names is None else embed_names
+        conditions = [self._condition(column, expression, params) for column, expression in self.filters]
+        return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    def _order_limit(self, params: list) -> str:
+        sql = ""
+        if self.params.get("order"):
+            terms = []
+            for term in self.params["order"].split(","):
+                column, *modifiers = term.split(".")
+                direction = " DESC" if "desc" in modifiers else ""
+                nulls = " NULLS FIRST" if "nullsfirst" in modifiers else " NULLS LAST" if "nullslast" in modifiers else ""
+                terms.append(f"t.{ident(column)}{direction}{nulls}")
+            sql += " ORDER BY " + ", ".join(terms)
+        if "limit" in self.params or "offset" in self.params:
+            params.extend([int(self.params.get("limit", -1)), int(self.params.get("offset", 0))])
+            sql += " LIMIT ? OFFSET ?"
+        return sql
+
+    # ---- Reads ----
+    def _select(self, conn) -> tuple:
+        plain, embeds = parse_select(self._select_cols)
+        params = []
+        where = self._where(params)
+        count = None
+        if self._count:
+            count = conn.execute(f"SELECT COUNT(*) FROM {ident(self.table_name)} t{where}", params).fetchone()[0]
+        if self._head:
+            return [], count
+        return self._fetch(conn, plain, embeds, where, params, self._order_limit(params)), count
+
+    def _fetch(self, conn, plain: list, embeds: dict, where: str, params: list, tail: str = "") -> list:
+        columns = ["t.*" if c == "*" else f"t.{ident(c)}" for c in plain] or ["t.*"]
+        # Keys the embeds join on, fetched even when not asked for
+        extra = []
+        for related, sub in embeds.items():
+            local = self._relation(related)[0]
+            if sub is not None and "*" not in plain and local not in plain:
+                extra.append(local)
+                columns.append(f"t.{ident(local)}")
+        sql = f"SELECT {', '.join(columns)} FROM {ident(self.table_name)} t{where}{tail}"
+        rows = self.store.to_dicts(self.table_name, conn.execute(sql, params))
+        for related, sub in embeds.items():
+            if sub is not None:
+                self._embed(conn, rows, related, sub)
+        for row in rows:
+            for key in extra:
+                row.pop(key, None)
+        return rows
+
+    def _embed(self, conn, rows: list, related: str, sub: tuple):
+        """Attach `related` rows the way PostgREST nests them: an object (or
+        null) for a to-one link, a list for a to-many one"""
+        local, remote, many = self._relation(related)
+        plain, embeds = sub
+        columns = list(plain)
+        if "*" not in columns and remote not in columns:
+            columns.append(remote)
+        keys = list({row[local] for row in rows if row.get(local) is not None})
+        found = []
+        for start in range(0, len(keys), 500):
+            child = SQLiteTable(self.store, related).in_(remote, keys[start:start + 500])
+            params = []
+            where = child._where(params, set())
+            found.extend(child._fetch(conn, columns, embeds, where, params))
+        grouped = {}
+        for item in found:
+            grouped.setdefault(item[remote], []).append(item)
+        if columns != plain:
+            for item in found:
+                item.pop(remote, None)
+        for row in rows:
+            matches = grouped.get(row.get(local), [])
+            row[related] = matches if many else (matches[0] if matches else None)
+
+    async def execute(self, raw: bool = False):
+        fallback = ([], 0 if self._count else None)
+        rows, count = await self.store.run(self._guarded, "SELECT", fallback, self._select, timeout=self._timeout)
+        if raw:
+            # Same layout as Postgres' json_agg, which pagination.last_row relies on
+            body = b"[" + b", \n ".join(orjson.dumps(row) for row in rows) + b"]"
+            return RawResponse(body, len(rows), count)
+        return SupabaseResponse(rows, count=count)
+
+    def _guarded(self, conn, label: str, fallback, func, *args):
+        """Query errors are logged and answered with empty data, the way the
+        PostgREST client treats a 4xx; transient ones propagate. A callable
+        fallback is called with the error to build that answer."""
+        try:
+            return func(conn, *args)
+        except sqlite3.Error as e:
+            message = str(e).lower()
+            if isinstance(e, sqlite3.OperationalError) and (
+                    "interrupted" in message or any(t in message for t in TRANSIENT_ERRORS)):
+                raise
+            logger.warning("%s %s error: %s", label, self.table_name, e)
+            return fallback(e) if callable(fallback) else fallback
+
+    # ---- Writes ----
+    def _encode(self, value):
+        return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+    def _insert(self, conn, rows: list, on_conflict: str = None) -> list:
+        created = []
+        conn.execute("BEGIN IMMEDIATE")
+        for row in rows:
+            columns = list(row)
+            sql = (f"INSERT INTO {ident(self.table_name)} ({', '.join(ident(c) for c in columns)}) "
+                   f"VALUES ({', '.join('?' * len(columns))})")
+            if on_conflict:
+                keys = [c.strip() for c in on_conflict.split(",")]
+                updates = [f"{ident(c)} = excluded.{ident(c)}" for c in columns if c not in keys]
+                sql += f" ON CONFLICT ({', '.join(ident(k) for k in keys)}) "
+                sql += f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+            cursor = conn.execute(sql + " RETURNING *", [self._encode(row[c]) for c in columns])
+            created.extend(self.store.to_dicts(self.table_name, cursor))
+        conn.commit()
+        return created, None
+
+    async def insert(self, data: dict | list, on_conflict: str = None):
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return SupabaseResponse([])
+        result, error = await self.store.run(self._guarded, "INSERT", lambda e: ([], str(e)), self._insert,
+                                             rows, on_conflict, timeout=self._timeout)
+        return SupabaseResponse(result, error=error)
+
+    def _write(self, conn, sql: str, params: list, returning: str) -> list:
+        conn.execute("BEGIN IMMEDIATE")
+        if returning == "minimal":
+            conn.execute(sql, params)
+            rows = []
+        else:
+            rows = self.store.to_dicts(self.table_name, conn.execute(sql + " RETURNING *", params))
+        conn.commit()
+        return rows
+
+    async def update(self, data: dict, returning: str = "representation"):
+        if not data:
+            return SupabaseResponse([])
+        params = [self._encode(v) for v in data.values()]
+        assignments = ", ".join(f"{ident(c)} = ?" for c in data)
+        where = self._where(params)
+        sql = f"UPDATE {ident(self.table_name)} AS t SET {assignments}{where}"
+        result = await self.store.run(self._guarded, "UPDATE", [], self._write, sql, params, returning,
+                                      timeout=self._timeout)
+        return SupabaseResponse(result)
+
+    async def delete(self, returning: str = "representation"):
+        if not self.filters:
+            logger.error("DELETE refused: no filter params set for %s", self.table_name)
+            return SupabaseResponse([])
+        params = []
+        sql = f"DELETE FROM {ident(self.table_name)} AS t{self._where(params)}"
+        result = await self.store.run(self._guarded, "DELETE", [], self._write, sql, params, returning,
+                                      timeout=self._timeout)
+        return SupabaseResponse(result)
@@ -0,0 +1,239 @@
+import asyncio
+import copy
+from abc import ABC, abstractmethod
+
+# Characters PostgREST uses as operator syntax are left unescaped for readability
+_SAFE_CHARS = ",.()*:!"
+_RESERVED = set(',.:()" ')
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def quote_value(value) -> str:
+    """Double-quote in.() list items that contain PostgREST reserved characters"""
+    text = _format_value(value)
+    if any(ch in _RESERVED for ch in text):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+class TableQuery(ABC):
+    """Query builder shared by the storage backends.
+
+    Filters, ordering and paging are recorded in PostgREST's own syntax
+    (column, "op.value") so the PostgREST client can send them as-is and
+    other backends compile the same representation. Every builder call
+    returns a copy, so a base query can be reused.
+    """
+
+    def __init__(self, table: str):
+        self.table_name = table
+        self.filters = []
+        self.params = {}
+        self._select_cols = "*"
+        self._count = None
+        self._head = False
+        self._timeout = None
+
+    def _clone(self):
+        """Create a copy to avoid param pollution"""
+        clone = copy.copy(self)
+        clone.filters = list(self.filters)
+        clone.params = self.params.copy()
+        return clone
+
+    def select(self, columns: str = "*", count: str = None, head: bool = False):
+        """Choose columns; count='exact'|'planned'|'estimated' asks for the
+        total row count, and head=True returns only that count"""
+        if count not in (None, "exact", "planned", "estimated"):
+            raise ValueError(f"Invalid count mode: {count}")
+        clone = self._clone()
+        clone._select_cols = columns
+        clone._count = count
+        clone._head = head
+        return clone
+
+    # ---- Filters ----
+    def _filter(self, column: str, op: str, value):
+        clone = self._clone()
+        clone.filters.append((column, f"{op}.{_format_value(value)}"))
+        return clone
+
+    def eq(self, column: str, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column: str, value):
+        return self._filter(column, "neq", value)
+
+    def lt(self, column: str, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column: str, value):
+        return self._filter(column, "lte", value)
+
+    def gt(self, column: str, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column: str, value):
+        return self._filter(column, "gte", value)
+
+    def like(self, column: str, pattern: str):
+        """Case-sensitive pattern match, use * (or %) as wildcard"""
+        return self._filter(column, "like", pattern)
+
+    def ilike(self, column: str, pattern: str):
+        """Case-insensitive pattern match, use * (or %) as wildcard"""
+        return self._filter(column, "ilike", pattern)
+
+    def is_(self, column: str, value):
+        """IS check, value is None/True/False or 'null'/'true'/'false'/'unknown'"""
+        return self._filter(column, "is", "null" if value is None else value)
+
+    def in_(self, column: str, values):
+        items = ",".join(quote_value(v) for v in values)
+        clone = self._clone()
+        clone.filters.append((column, f"in.({items})"))
+        return clone
+
+    def or_(self, filters: str):
+        """PostgREST disjunction, e.g. or_("return_date.is.null,due_date.lt.2024-01-01")"""
+        clone = self._clone()
+        clone.filters.append(("or", f"({filters})"))
+        return clone
+
+    def timeout(self, seconds: float):
+        """Override the backend's default timeout for this call only"""
+        clone = self._clone()
+        clone._timeout = seconds
+        return clone
+
+    def order(self, column: str, desc: bool = False):
+        """Add a sort key; repeated calls add tie-breakers"""
+        clone = self._clone()
+        term = f"{column}.desc" if desc else column
+        existing = clone.params.get("order")
+        clone.params["order"] = f"{existing},{term}" if existing else term
+        return clone
+
+    def limit(self, count: int):
+        clone = self._clone()
+        clone.params["limit"] = str(count)
+        return clone
+
+    def offset(self, count: int):
+        clone = self._clone()
+        clone.params["offset"] = str(count)
+        return clone
+
+    def range(self, start: int, end: int):
+        """Rows start..end inclusive (0-based), like supabase-py"""
+        return self.offset(start).limit(end - start + 1)
+
+    # ---- Execution (each backend implements these) ----
+    @abstractmethod
+    async def execute(self, raw: bool = False):
+        """Run the query. raw=True returns a RawResponse holding the rows as a
+        JSON array, for endpoints that pass rows through as-is."""
+
+    @abstractmethod
+    async def insert(self, data: dict | list, on_conflict: str = None):
+        """Insert rows; with on_conflict (unique columns) an existing row that
+        collides is updated instead, i.e. an upsert. The statement is all or
+        nothing; if it is rejected, SupabaseResponse.error says why."""
+
+    @abstractmethod
+    async def update(self, data: dict, returning: str = "representation"):
+        """Update matching rows; returning='minimal' skips sending them back"""
+
+    @abstractmethod
+    async def delete(self, returning: str = "representation"):
+        """Delete matching rows; returning='minimal' skips sending them back"""
+
+class Storage(ABC):
+    """What the app needs from its database, whichever backend holds it.
+
+    Backends provide table(), rpc() and the lifecycle hooks; the batch
+    helpers below are written against table() and shared by all of them.
+    """
+
+    @abstractmethod
+    def table(self, name: str) -> TableQuery:
+        """Query builder for a table or view"""
+
+    @abstractmethod
+    async def rpc(self, function: str, params: dict = None):
+        """Call a database function. A failure inside the function comes back
+        as SupabaseResponse.error, so callers can surface it as a 4xx."""
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def pool_stats(self) -> dict:
+        return {}
+
+    # ---- Batch operations (set-based maintenance jobs) ----
+    async def anti_join(self, table: str, related: str, columns: str = "id", page_size: int = 1000) -> list:
+        """Rows of `table` with no matching `related` rows, e.g. books without copies.
+
+        Uses the embedded-resource null filter, so the anti-join runs in the
+        database and only the orphan rows come back, keyset-paged by id.
+        """
+        rows = []
+        last_id = None
+        while True:
+            query = self.table(table).select(f"{columns},{related}()").is_(related, None).order("id").limit(page_size)
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            page = await query.execute()
+            rows.extend(page.data)
+            if len(page.data) < page_size:
+                return rows
+            last_id = page.data[-1]["id"]
+
+    async def bulk_insert(self, table: str, rows: list, chunk_size: int = 500, on_chunk=None) -> int:
+        """Insert rows in list-payload chunks, returns how many were created"""
+        created = 0
+        for start in range(0, len(rows), chunk_size):
+            result = await self.table(table).insert(rows[start:start + chunk_size])
+            created += len(result.data)
+            if on_chunk:
+                on_chunk(min(start + chunk_size, len(rows)), len(rows))
+        return created
+
+    async def bulk_update(self, table: str, updates: list, chunk_size: int = 200, concurrency: int = 4) -> int:
+        """Apply (values, ids) pairs as updates filtered by id=in.(...),
+        chunking the ids so URLs stay short and running at most `concurrency`
+        at a time. Returns how many ids were sent."""
+        semaphore = asyncio.Semaphore(concurrency)
+        async def run(values, ids):
+            async with semaphore:
+                return await self.table(table).in_("id", ids).update(values, returning="minimal")
+        await asyncio.gather(*(run(values, ids[start:start + chunk_size])
+                               for values, ids in updates
+                               for start in range(0, len(ids), chunk_size)))
+        return sum(len(ids) for _, ids in updates)
+
+    async def bulk_delete(self, queries: list, concurrency: int = 4) -> list:
+        """Run filtered deletes concurrently, at most `concurrency` at a time"""
+        semaphore = asyncio.Semaphore(concurrency)
+        async def run(query):
+            async with semaphore:
+                return await query.delete(returning="minimal")
+        return await asyncio.gather(*(run(q) for q in queries))
+
+class RawResponse:
+    """Undecoded JSON array of rows plus its row count"""
+    def __init__(self, body: bytes, rows: int, count: int = None):
+        self.body = body
+        self.rows = rows
+        self.count = count
+
+class SupabaseResponse:
+    def __init__(self, data, count: int = None, error: str = None):
+        self.data = data if isinstance(data, list) else [data] if data else []
+        self.count = count if count is not None else len(self.data)
+        self.error = error
@@ -0,0 +1,72 @@
+"""Overdue-day and fine computation over synthetic open loans.
+
+Compares a per-row Python loop (what deriving the status row by row on
+every read amounts to) with the vectorised compute_fines() the fines job
+runs per page, and times changed_groups(), which collapses one page of
+changed loans into bulk PATCHes. Nothing is sent to the database.
+
+Run from backend/:  python -m benchmarks.overdue_fines [loans] [page_size]
+"""
+import sys
+import time
+from datetime import date
+import numpy as np
+from app.config import FINE_GRACE_DAYS, FINE_MAX, FINE_RATES
+from app.fines import PAGE_SIZE, compute_fines, changed_groups, parse_rates
+
+MEMBER_TYPES = ("Student", "Faculty", "Staff", "")
+
+def synthetic_loans(count: int, today: date):
+    """Due dates spread 60 days either side of today, sorted like the job pages them"""
+    rng = np.random.default_rng(42)
+    due = np.sort(np.datetime64(today, "D") + rng.integers(-60, 60, count).astype("timedelta64[D]"))
+    types = np.asarray(MEMBER_TYPES)[rng.integers(0, len(MEMBER_TYPES), count)]
+    return due.astype(str).tolist(), types.tolist()
+
+def row_by_row(due_dates: list, member_types: list, today: date, rates: dict) -> tuple:
+    days, fines = [], []
+    for due, member_type in zip(due_dates, member_types):
+        late = max((today - date.fromisoformat(due)).days, 0)
+        rate = rates.get(member_type, rates["default"])
+        days.append(late)
+        fines.append(round(min(max(late - FINE_GRACE_DAYS, 0) * rate, FINE_MAX), 2))
+    return days, fines
+
+def timed(label: str, count: int, func):
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} {elapsed * 1000:9.1f}ms  {count / elapsed / 1e6:7.2f}M loans/s")
+    return result
+
+def main(count: int, page_size: int):
+    today = date.today()
+    rates = parse_rates(FINE_RATES)
+    due_dates, member_types = synthetic_loans(count, today)
+    print(f"loans={count}  page size={page_size}  rates={rates}")
+
+    expected = timed("row by row", count, lambda: row_by_row(due_dates, member_types, today, rates))
+    days, fines = timed("vectorised", count, lambda: compute_fines(due_dates, member_types, today, rates))
+    assert days.tolist() == expected[0] and np.allclose(fines, expected[1])
+
+    def pages():
+        # Stored figures one day behind, so every overdue loan needs a write
+        ids = np.arange(count).astype(str).astype(object)
+        requests = 0
+        for start in range(0, count, page_size):
+            end = start + page_size
+            page_days, page_fines = compute_fines(due_dates[start:end], member_types[start:end], today, rates)
+            old_days = np.maximum(page_days - 1, 0)
+            old_fines = np.round(np.maximum(page_fines - 1, 0), 2)
+            requests += len(changed_groups(ids[start:end], page_days, page_fines, old_days, old_fines))
+        return requests
+
+    requests = timed("paged + grouping", count, pages)
+    stale = int((days > 0).sum())
+    print(f"{stale} changed loans -> {requests} bulk PATCH groups "
+          f"(one request per group per 200 ids, vs {stale} single-row updates)")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else PAGE_SIZE
+    main(count, page_size)
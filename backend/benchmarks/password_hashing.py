@@ -0,0 +1,55 @@
+"""Login throughput with bcrypt verification under concurrency.
+
+Compares verifying on the event loop (what a plain passlib call in an
+async endpoint does) with the bounded hashing pool in app.auth, and
+reports logins/second plus how late a 10ms heartbeat task runs, which is
+what every other request on the worker experiences.
+
+Run from backend/:  python -m benchmarks.password_hashing [concurrency] [logins]
+Keep concurrency at or below HASH_QUEUE_MAX, beyond it the pool sheds with 503.
+"""
+import asyncio
+import statistics
+import sys
+import time
+from app.auth import pwd_context, verify_password
+from app.config import BCRYPT_ROUNDS, HASH_POOL_WORKERS
+
+async def heartbeat(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+async def run(label: str, verify, concurrency: int, logins: int, hashed: str):
+    lags, stop = [], asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            assert await verify("correct horse", hashed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    lags = sorted(lags) or [0.0]
+    print(f"{label:<14} {logins / elapsed:8.1f} logins/s   "
+          f"loop lag p50={statistics.median(lags):7.1f}ms  p99={lags[int(len(lags) * 0.99) - 1]:7.1f}ms")
+
+async def inline_verify(plain: str, hashed: str) -> bool:
+    return pwd_context.verify(plain, hashed)
+
+async def main(concurrency: int, logins: int):
+    hashed = pwd_context.hash("correct horse")
+    print(f"bcrypt rounds={BCRYPT_ROUNDS}  pool workers={HASH_POOL_WORKERS}  "
+          f"concurrency={concurrency}  logins={logins}")
+    await run("event loop", inline_verify, concurrency, logins, hashed)
+    await run("hashing pool", verify_password, concurrency, logins, hashed)
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    logins = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    asyncio.run(main(concurrency, logins))
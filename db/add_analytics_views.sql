@@ -0,0 +1,20 @@
+-- ============================================
+-- ADD AGGREGATE VIEWS FOR /analytics/summary
+-- Run this in Supabase SQL Editor (existing databases only,
+-- setup_database.sql already creates them)
+-- ============================================
+
+-- Books per language
+CREATE OR REPLACE VIEW books_by_language_view AS
+SELECT COALESCE(language, 'Unknown') as language, COUNT(*)::INT as count
+FROM books
+GROUP BY COALESCE(language, 'Unknown');
+
+-- Members per member type
+CREATE OR REPLACE VIEW members_by_type_view AS
+SELECT COALESCE(member_type, 'Unknown') as member_type, COUNT(*)::INT as count
+FROM members
+GROUP BY COALESCE(member_type, 'Unknown');
+
+-- Verify
+SELECT * FROM books_by_language_view;
@@ -0,0 +1,16 @@
+-- ============================================
+-- ADD FINE COLUMNS FOR THE OVERDUE FINES JOB
+-- Run this in Supabase SQL Editor (existing databases only,
+-- setup_database.sql already creates them)
+-- ============================================
+
+-- Written back by the backend's fines job (see backend/app/fines.py)
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS days_overdue INT DEFAULT 0;
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS fine_amount NUMERIC(10, 2) DEFAULT 0;
+
+-- Open loans by due date, the order the job pages through them
+CREATE INDEX IF NOT EXISTS idx_transactions_open_due ON transactions (due_date, id) WHERE return_date IS NULL;
+
+-- Verify
+SELECT id, due_date, days_overdue, fine_amount FROM transactions
+WHERE return_date IS NULL ORDER BY due_date LIMIT 10;
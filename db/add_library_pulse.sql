@@ -0,0 +1,25 @@
+-- ============================================
+-- ADD LIBRARY_PULSE TABLE FOR /analytics/pulse/history
+-- Run this in Supabase SQL Editor (existing databases only,
+-- setup_database.sql already creates it)
+-- ============================================
+
+-- One row per day, upserted by the backend on each reconcile
+CREATE TABLE IF NOT EXISTS library_pulse (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    snapshot_date DATE UNIQUE NOT NULL,
+    total_books INT DEFAULT 0,
+    total_copies INT DEFAULT 0,
+    available_copies INT DEFAULT 0,
+    issued_copies INT DEFAULT 0,
+    overdue_count INT DEFAULT 0,
+    active_members INT DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE library_pulse ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "public_library_pulse" ON library_pulse;
+CREATE POLICY "public_library_pulse" ON library_pulse FOR ALL USING (true) WITH CHECK (true);
+
+-- Verify
+SELECT * FROM library_pulse ORDER BY snapshot_date DESC LIMIT 7;
@@ -0,0 +1,101 @@
+-- ============================================
+-- ATOMIC CIRCULATION FUNCTIONS
+-- Called by the API through PostgREST /rpc/<name>.
+-- Run this in Supabase SQL Editor (setup_database.sql already includes them)
+-- ============================================
+
+-- Issue: claim the copy and create the loan in one statement batch.
+-- The conditional UPDATE is the lock - two desks issuing the same copy
+-- cannot both see is_available = TRUE.
+CREATE OR REPLACE FUNCTION issue_book(p_book_copy_id UUID, p_member_id UUID)
+RETURNS SETOF transactions
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_days INT;
+BEGIN
+    SELECT COALESCE(max_borrow_days, 14) INTO v_days FROM members WHERE id = p_member_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Member not found';
+    END IF;
+
+    UPDATE book_copies SET is_available = FALSE
+    WHERE id = p_book_copy_id AND is_available = TRUE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Book copy is not available';
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO transactions (book_copy_id, member_id, issue_date, due_date)
+    VALUES (p_book_copy_id, p_member_id, NOW(), CURRENT_DATE + v_days)
+    RETURNING *;
+END;
+$$;
+
+-- Return by transaction id
+CREATE OR REPLACE FUNCTION return_book(p_transaction_id UUID)
+RETURNS SETOF transactions
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_txn transactions;
+BEGIN
+    UPDATE transactions SET return_date = NOW()
+    WHERE id = p_transaction_id AND return_date IS NULL
+    RETURNING * INTO v_txn;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Transaction not found or already returned';
+    END IF;
+
+    UPDATE book_copies SET is_available = TRUE WHERE id = v_txn.book_copy_id;
+    RETURN NEXT v_txn;
+END;
+$$;
+
+-- Return by scanned copy id (closes that copy's open loan)
+CREATE OR REPLACE FUNCTION return_book_copy(p_book_copy_id UUID)
+RETURNS SETOF transactions
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_txn_id UUID;
+BEGIN
+    SELECT id INTO v_txn_id FROM transactions
+    WHERE book_copy_id = p_book_copy_id AND return_date IS NULL
+    ORDER BY issue_date DESC
+    LIMIT 1;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'No active loan for this copy';
+    END IF;
+
+    RETURN QUERY SELECT * FROM return_book(v_txn_id);
+END;
+$$;
+
+-- Batch issue/return for a stack of scanned copies. Each copy runs in its
+-- own subtransaction so one failure does not undo the others.
+CREATE OR REPLACE FUNCTION circulation_batch(p_action TEXT, p_book_copy_ids UUID[], p_member_id UUID DEFAULT NULL)
+RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_copy_id UUID;
+    v_txn transactions;
+    v_results JSONB := '[]'::JSONB;
+BEGIN
+    IF p_action NOT IN ('issue', 'return') THEN
+        RAISE EXCEPTION 'Unknown action: %', p_action;
+    END IF;
+
+    FOREACH v_copy_id IN ARRAY p_book_copy_ids LOOP
+        BEGIN
+            IF p_action = 'issue' THEN
+                SELECT * INTO v_txn FROM issue_book(v_copy_id, p_member_id);
+            ELSE
+                SELECT * INTO v_txn FROM return_book_copy(v_copy_id);
+            END IF;
+            v_results := v_results || jsonb_build_object('book_copy_id', v_copy_id, 'ok', TRUE, 'transaction', to_jsonb(v_txn));
+        EXCEPTION WHEN OTHERS THEN
+            v_results := v_results || jsonb_build_object('book_copy_id', v_copy_id, 'ok', FALSE, 'error', SQLERRM);
+        END;
+    END LOOP;
+
+    RETURN v_results;
+END;
+$$;
@@ -8,6 +8,12 @@ DROP VIEW IF EXISTS available_books_view CASCADE;
 DROP VIEW IF EXISTS current_transactions_view CASCADE;
 DROP VIEW IF EXISTS subject_performance_view CASCADE;
 DROP VIEW IF EXISTS member_activity_view CASCADE;
+DROP VIEW IF EXISTS books_by_language_view CASCADE;
+DROP VIEW IF EXISTS members_by_type_view CASCADE;
+DROP FUNCTION IF EXISTS circulation_batch CASCADE;
+DROP FUNCTION IF EXISTS return_book_copy CASCADE;
+DROP FUNCTION IF EXISTS return_book CASCADE;
+DROP FUNCTION IF EXISTS issue_book CASCADE;
 
 -- STEP 2: Drop all TABLES (order matters - children first)
 DROP TABLE IF EXISTS transactions CASCADE;
@@ -26,7 +32,7 @@ DROP TABLE IF EXISTS subject_velocity CASCADE;
 DROP TABLE IF EXISTS sentiments CASCADE;
 
 -- ============================================
--- CREATE 5 SIMPLE TABLES
+-- CREATE 6 SIMPLE TABLES
 -- ============================================
 
 -- 1. USERS - for login
@@ -73,7 +79,25 @@ CREATE TABLE transactions (
     member_id UUID REFERENCES members(id),
     issue_date TIMESTAMPTZ DEFAULT NOW(),
     due_date DATE NOT NULL,
-    return_date TIMESTAMPTZ
+    return_date TIMESTAMPTZ,
+    days_overdue INT DEFAULT 0,
+    fine_amount NUMERIC(10, 2) DEFAULT 0
+);
+
+-- Open loans by due date, for the fines job
+CREATE INDEX idx_transactions_open_due ON transactions (due_date, id) WHERE return_date IS NULL;
+
+-- 6. LIBRARY_PULSE - daily counter snapshots (written by the backend)
+CREATE TABLE library_pulse (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    snapshot_date DATE UNIQUE NOT NULL,
+    total_books INT DEFAULT 0,
+    total_copies INT DEFAULT 0,
+    available_copies INT DEFAULT 0,
+    issued_copies INT DEFAULT 0,
+    overdue_count INT DEFAULT 0,
+    active_members INT DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
 -- ============================================
@@ -107,6 +131,122 @@ LEFT JOIN books b ON bc.book_id = b.id
 LEFT JOIN members m ON t.member_id = m.id
 ORDER BY t.issue_date DESC;
 
+-- ============================================
+-- AGGREGATE VIEWS (analytics summary)
+-- ============================================
+
+-- Books per language
+CREATE VIEW books_by_language_view AS
+SELECT COALESCE(language, 'Unknown') as language, COUNT(*)::INT as count
+FROM books
+GROUP BY COALESCE(language, 'Unknown');
+
+-- Members per member type
+CREATE VIEW members_by_type_view AS
+SELECT COALESCE(member_type, 'Unknown') as member_type, COUNT(*)::INT as count
+FROM members
+GROUP BY COALESCE(member_type, 'Unknown');
+
+-- ============================================
+-- CIRCULATION FUNCTIONS (called via /rpc)
+-- ============================================
+
+-- Issue: claim the copy and create the loan in one statement batch.
+-- The conditional UPDATE is the lock - two desks issuing the same copy
+-- cannot both see is_available = TRUE.
+CREATE OR REPLACE FUNCTION issue_book(p_book_copy_id UUID, p_member_id UUID)
+RETURNS SETOF transactions
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_days INT;
+BEGIN
+    SELECT COALESCE(max_borrow_days, 14) INTO v_days FROM members WHERE id = p_member_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Member not found';
+    END IF;
+
+    UPDATE book_copies SET is_available = FALSE
+    WHERE id = p_book_copy_id AND is_available = TRUE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Book copy is not available';
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO transactions (book_copy_id, member_id, issue_date, due_date)
+    VALUES (p_book_copy_id, p_member_id, NOW(), CURRENT_DATE + v_days)
+    RETURNING *;
+END;
+$$;
+
+-- Return by transaction id
+CREATE OR REPLACE FUNCTION return_book(p_transaction_id UUID)
+RETURNS SETOF transactions
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_txn transactions;
+BEGIN
+    UPDATE transactions SET return_date = NOW()
+    WHERE id = p_transaction_id AND return_date IS NULL
+    RETURNING * INTO v_txn;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Transaction not found or already returned';
+    END IF;
+
+    UPDATE book_copies SET is_available = TRUE WHERE id = v_txn.book_copy_id;
+    RETURN NEXT v_txn;
+END;
+$$;
+
+-- Return by scanned copy id (closes that copy's open loan)
+CREATE OR REPLACE FUNCTION return_book_copy(p_book_copy_id UUID)
+RETURNS SETOF transactions
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_txn_id UUID;
+BEGIN
+    SELECT id INTO v_txn_id FROM transactions
+    WHERE book_copy_id = p_book_copy_id AND return_date IS NULL
+    ORDER BY issue_date DESC
+    LIMIT 1;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'No active loan for this copy';
+    END IF;
+
+    RETURN QUERY SELECT * FROM return_book(v_txn_id);
+END;
+$$;
+
+-- Batch issue/return for a stack of scanned copies. Each copy runs in its
+-- own subtransaction so one failure does not undo the others.
+CREATE OR REPLACE FUNCTION circulation_batch(p_action TEXT, p_book_copy_ids UUID[], p_member_id UUID DEFAULT NULL)
+RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_copy_id UUID;
+    v_txn transactions;
+    v_results JSONB := '[]'::JSONB;
+BEGIN
+    IF p_action NOT IN ('issue', 'return') THEN
+        RAISE EXCEPTION 'Unknown action: %', p_action;
+    END IF;
+
+    FOREACH v_copy_id IN ARRAY p_book_copy_ids LOOP
+        BEGIN
+            IF p_action = 'issue' THEN
+                SELECT * INTO v_txn FROM issue_book(v_copy_id, p_member_id);
+            ELSE
+                SELECT * INTO v_txn FROM return_book_copy(v_copy_id);
+            END IF;
+            v_results := v_results || jsonb_build_object('book_copy_id', v_copy_id, 'ok', TRUE, 'transaction', to_jsonb(v_txn));
+        EXCEPTION WHEN OTHERS THEN
+            v_results := v_results || jsonb_build_object('book_copy_id', v_copy_id, 'ok', FALSE, 'error', SQLERRM);
+        END;
+    END LOOP;
+
+    RETURN v_results;
+END;
+$$;
+
 -- ============================================
 -- SECURITY POLICIES
 -- ============================================
@@ -115,12 +255,14 @@ ALTER TABLE members ENABLE ROW LEVEL SECURITY;
 ALTER TABLE books ENABLE ROW LEVEL SECURITY;
 ALTER TABLE book_copies ENABLE ROW LEVEL SECURITY;
 ALTER TABLE transactions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE library_pulse ENABLE ROW LEVEL SECURITY;
 
 CREATE POLICY "public_users" ON users FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "public_members" ON members FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "public_books" ON books FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "public_book_copies" ON book_copies FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "public_transactions" ON transactions FOR ALL USING (true) WITH CHECK (true);
+CREATE POLICY "public_library_pulse" ON library_pulse FOR ALL USING (true) WITH CHECK (true);
 
 -- ============================================
 -- DEFAULT ADMIN (password: admin123)
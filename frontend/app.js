@@ -1,5 +1,7 @@
 // Data stores
 let booksData = [], membersData = [], transactionsData = [], availableBooksData = [];
+// Overview state, kept current by /events deltas between full refreshes
+let pulseData = null, currentTxnsData = [];
 let availabilityChart, popularBooksChart, trendChart;
 let isRefreshing = false;
 let refreshDebounceTimer = null;
@@ -37,37 +39,94 @@ function showToast(msg, type = '') {
     setTimeout(() => toast.classList.add('hidden'), 3000);
 }
 
-// API calls - with cache busting and better error handling
+// Last response per GET endpoint with its ETag; sent back as If-None-Match so
+// unchanged lists and summaries come back as an empty 304
+const responseCache = new Map();
+const RESPONSE_CACHE_MAX = 100;
+
+function clearResponseCache() {
+    responseCache.clear();
+}
+
+// API calls - conditional GETs and better error handling
 async function fetchAPI(endpoint, options = {}) {
     try {
-        const separator = endpoint.includes('?') ? '&' : '?';
-        const url = options.method && options.method !== 'GET' 
-            ? `${API_BASE_URL}${endpoint}`
-            : `${API_BASE_URL}${endpoint}${separator}_t=${Date.now()}`;
+        const isGet = !options.method || options.method === 'GET';
+        const cached = isGet ? responseCache.get(endpoint) : null;
         
-        const response = await fetch(url, {
+        const response = await fetch(`${API_BASE_URL}${endpoint}`, {
             ...options,
+            // We revalidate ourselves; keep the browser cache from answering 304s for us
+            cache: 'no-store',
             headers: { 
                 'Content-Type': 'application/json', 
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache',
+                ...(cached ? { 'If-None-Match': cached.etag } : {}),
                 ...getAuthHeaders(), 
                 ...options.headers 
             }
         });
         
+        if (response.status === 304 && cached) {
+            // Refresh recency so often-used endpoints stay cached
+            responseCache.delete(endpoint);
+            responseCache.set(endpoint, cached);
+            return cached.data;
+        }
+        
+        // Rate limited or the server is shedding load: honour a short
+        // Retry-After once for reads instead of failing straight away
+        const retryAfter = Number(response.headers.get('Retry-After'));
+        if ((response.status === 429 || response.status === 503) && !options._retried
+            && isGet && retryAfter > 0 && retryAfter <= 5) {
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+            return fetchAPI(endpoint, { ...options, _retried: true });
+        }
+
         if (!response.ok) {
             const errorText = await response.text();
             console.error('API Error:', endpoint, response.status, errorText);
             throw new Error(errorText || `HTTP ${response.status}`);
         }
-        return await response.json();
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (isGet && etag) {
+            responseCache.delete(endpoint);
+            responseCache.set(endpoint, { etag, data });
+            if (responseCache.size > RESPONSE_CACHE_MAX) {
+                responseCache.delete(responseCache.keys().next().value);
+            }
+        }
+        return data;
     } catch (e) {
         console.error('API Error:', endpoint, e);
         return null;
     }
 }
 
+// Keyset-paginated lists load one page at a time; "Load more" fetches the
+// next one from the cursor kept here (null once the list is exhausted)
+const listCursors = {};
+const listLoading = {};
+
+async function fetchPage(name, endpoint, more = false, pageSize = 200) {
+    if (!more) listCursors[name] = null;
+    else if (!listCursors[name] || listLoading[name]) return null;
+    const separator = endpoint.includes('?') ? '&' : '?';
+    const cursor = listCursors[name];
+    const url = `${endpoint}${separator}limit=${pageSize}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : '');
+    listLoading[name] = true;
+    try {
+        const result = await fetchAPI(url);
+        if (!result) return null;
+        listCursors[name] = result.next_cursor || null;
+        return result.data || [];
+    } finally {
+        listLoading[name] = false;
+        const wrapper = document.getElementById(`${name}LoadMore`);
+        if (wrapper) wrapper.hidden = !listCursors[name];
+    }
+}
+
 // Initialize
 async function initDashboard() {
     if (userRole === 'admin') {
@@ -78,66 +137,163 @@ async function initDashboard() {
     setupRealtime();
 }
 
-// Debounced refresh to prevent rapid updates
-function debouncedRefresh() {
+function activePageId() {
+    const activePage = document.querySelector('.page.active');
+    return activePage ? activePage.id.replace('page-', '') : null;
+}
+
+// Debounced refresh for `resync` events: the summary plus whichever open
+// page shows one of the changed tables
+let resyncTables = new Set();
+function debouncedRefresh(tables = []) {
+    tables.forEach(t => resyncTables.add(t));
     if (refreshDebounceTimer) clearTimeout(refreshDebounceTimer);
     refreshDebounceTimer = setTimeout(() => {
+        const changed = resyncTables;
+        resyncTables = new Set();
+        const all = changed.size === 0;
         refreshData();
-        // Refresh current page data
-        const activePage = document.querySelector('.page.active');
-        if (activePage) {
-            const pageId = activePage.id.replace('page-', '');
-            if (pageId === 'books') loadBooksPage();
-            else if (pageId === 'members') loadMembersPage();
-            else if (pageId === 'transactions') loadTransactionsPage();
-            else if (pageId === 'borrow') loadBorrowPage();
-        }
+        const pageId = activePageId();
+        if (pageId === 'books' && (all || changed.has('books'))) loadBooksPage();
+        else if (pageId === 'members' && (all || changed.has('members'))) loadMembersPage();
+        else if (pageId === 'transactions' && (all || changed.has('transactions'))) loadTransactionsPage();
+        else if (pageId === 'borrow') loadBorrowPage();
     }, 100);
 }
 
+// ---- Live updates: Server-Sent Events from /events ----
+// Read with fetch rather than EventSource so the JWT travels in the
+// Authorization header instead of the URL
+let eventsController = null;
+let lastEventId = null;
+
 function setupRealtime() {
-    if (!supabaseClient) {
-        console.warn('Supabase client not available for realtime');
-        return;
-    }
-    
+    if (userRole !== 'admin' || eventsController) return;
+    eventsController = new AbortController();
+    connectEvents(eventsController.signal);
+}
+
+function stopRealtime() {
+    if (eventsController) eventsController.abort();
+    eventsController = null;
+    lastEventId = null;
+}
+
+function setRealtimeStatus(live) {
     const statusDot = document.getElementById('realtimeStatus');
     const statusText = document.getElementById('realtimeText');
-    
+    if (statusDot) statusDot.className = live ? 'status-dot connected' : 'status-dot';
+    if (statusText) statusText.textContent = live ? 'Live' : 'Connecting';
+}
+
+async function connectEvents(signal) {
     try {
-        supabaseClient.channel('library-changes')
-            .on('postgres_changes', { event: '*', schema: 'public', table: 'books' }, debouncedRefresh)
-            .on('postgres_changes', { event: '*', schema: 'public', table: 'members' }, debouncedRefresh)
-            .on('postgres_changes', { event: '*', schema: 'public', table: 'transactions' }, debouncedRefresh)
-            .on('postgres_changes', { event: '*', schema: 'public', table: 'book_copies' }, debouncedRefresh)
-            .subscribe(status => {
-                console.log('Realtime status:', status);
-                statusDot.className = status === 'SUBSCRIBED' ? 'status-dot connected' : 'status-dot';
-                statusText.textContent = status === 'SUBSCRIBED' ? 'Live' : 'Connecting';
-            });
+        const response = await fetch(`${API_BASE_URL}/events`, {
+            signal,
+            cache: 'no-store',
+            headers: { ...getAuthHeaders(), ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {}) }
+        });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        setRealtimeStatus(true);
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                handleEventFrame(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+        }
     } catch (e) {
-        console.error('Realtime setup error:', e);
-        statusText.textContent = 'Offline';
+        if (signal.aborted) return;
+        console.warn('Event stream error:', e);
     }
+    if (signal.aborted) return;
+    setRealtimeStatus(false);
+    // Reconnect; Last-Event-ID lets the server replay what we missed
+    setTimeout(() => { if (!signal.aborted) connectEvents(signal); }, 3000);
+}
+
+function handleEventFrame(frame) {
+    let event = 'message', data = '';
+    frame.split('\n').forEach(line => {
+        if (line.startsWith('id: ')) lastEventId = line.slice(4);
+        else if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+    });
+    if (!data) return;
+    const handler = eventHandlers[event];
+    if (handler) handler(JSON.parse(data));
 }
 
+// Replace a row matching on `key`, or add it at the front (or back)
+function upsertRow(rows, key, row, atFront = true) {
+    const i = rows.findIndex(r => r[key] === row[key]);
+    if (i >= 0) rows[i] = { ...rows[i], ...row };
+    else if (atFront) rows.unshift(row);
+    else rows.push(row);
+}
+
+const eventHandlers = {
+    counters(deltas) {
+        if (!pulseData) return;
+        Object.entries(deltas).forEach(([key, delta]) => {
+            pulseData[key] = (pulseData[key] || 0) + delta;
+        });
+        renderKPIs(pulseData);
+        if (activePageId() === 'overview') renderCharts();
+    },
+    transactions({ rows }) {
+        rows.forEach(row => {
+            upsertRow(currentTxnsData, 'transaction_id', row);
+            upsertRow(transactionsData, 'transaction_id', row);
+        });
+        const pageId = activePageId();
+        if (pageId === 'overview') renderCharts();
+        else if (pageId === 'transactions') renderTransactions(transactionsData);
+        else if (pageId === 'borrow') renderReturnOptions(currentTxnsData);
+    },
+    book({ op, row, id }) {
+        if (op === 'delete') booksData = booksData.filter(b => b.id !== id);
+        else upsertRow(booksData, 'id', row, false);
+        if (activePageId() === 'books') renderBooks(booksData);
+    },
+    member({ op, row, id }) {
+        if (op === 'delete') membersData = membersData.filter(m => m.id !== id);
+        else upsertRow(membersData, 'id', row, false);
+        if (activePageId() === 'members') renderMembers(membersData);
+    },
+    resync({ tables }) {
+        debouncedRefresh(tables || []);
+    }
+};
+
 // Overview Page
 async function updateKPIs() {
     const summary = await fetchAPI('/analytics/summary');
     if (!summary) return null;
     
-    const p = summary.pulse || {};
+    pulseData = { ...(summary.pulse || {}) };
+    pulseData.total_books = pulseData.total_books || summary.total_books || 0;
+    pulseData.active_members = pulseData.active_members || summary.total_members || 0;
+    return renderKPIs(pulseData);
+}
+
+function renderKPIs(p) {
     const available = p.available_copies || 0;
     const issued = p.issued_copies || 0;
     const overdue = p.overdue_count || 0;
     
     // Animate number updates
-    animateValue('totalBooks', p.total_books || summary.total_books || 0);
+    animateValue('totalBooks', p.total_books || 0);
     animateValue('totalCopies', p.total_copies || 0);
     animateValue('availableCopies', available);
     animateValue('issuedCopies', issued);
     animateValue('overdueCount', overdue);
-    animateValue('activeMembers', p.active_members || summary.total_members || 0);
+    animateValue('activeMembers', p.active_members || 0);
     
     const overdueCard = document.getElementById('overdueCard');
     if (overdue > 0) {
@@ -181,7 +337,13 @@ async function updateCharts() {
     
     if (!summary) return;
     
-    const p = summary.pulse || {};
+    pulseData = { ...pulseData, ...(summary.pulse || {}) };
+    currentTxnsData = [...(currentTxns?.data || [])];
+    renderCharts();
+}
+
+function renderCharts() {
+    const p = pulseData || {};
     const available = p.available_copies || 0;
     const issued = p.issued_copies || 0;
     const overdue = p.overdue_count || 0;
@@ -213,7 +375,7 @@ async function updateCharts() {
     }
     
     // 2. Recent Transactions List
-    const txns = currentTxns?.data || [];
+    const txns = currentTxnsData;
     const recentList = document.getElementById('recentTxnList');
     if (recentList) {
         if (txns.length === 0) {
@@ -347,9 +509,10 @@ async function refreshData() {
 }
 
 // Books Page
-async function loadBooksPage() {
-    const result = await fetchAPI('/books');
-    booksData = result?.data || [];
+async function loadBooksPage(more = false) {
+    const rows = await fetchPage('books', '/books', more);
+    if (!rows) return;
+    booksData = more ? booksData.concat(rows) : rows;
     renderBooks(booksData);
 }
 
@@ -369,12 +532,22 @@ function renderBooks(books) {
     `).join('') || '<tr><td colspan="6">No books found</td></tr>';
 }
 
+// Search goes to the server-side index instead of filtering the full list
+let bookSearchTimer = null;
 function filterBooks() {
-    const q = document.getElementById('bookSearch').value.toLowerCase();
-    const filtered = booksData.filter(b => 
-        (b.title||'').toLowerCase().includes(q) || (b.author||'').toLowerCase().includes(q)
-    );
-    renderBooks(filtered);
+    const q = document.getElementById('bookSearch').value.trim();
+    if (bookSearchTimer) clearTimeout(bookSearchTimer);
+    if (!q) {
+        renderBooks(booksData);
+        return;
+    }
+    bookSearchTimer = setTimeout(async () => {
+        const result = await fetchAPI(`/books/search?q=${encodeURIComponent(q)}&limit=50`);
+        // Ignore responses for a query the user has already typed past
+        if (document.getElementById('bookSearch').value.trim() === q) {
+            renderBooks(result?.data || []);
+        }
+    }, 150);
 }
 
 async function addBook(e) {
@@ -431,9 +604,10 @@ async function deleteBook(id) {
 }
 
 // Members Page
-async function loadMembersPage() {
-    const result = await fetchAPI('/members');
-    membersData = result?.data || [];
+async function loadMembersPage(more = false) {
+    const rows = await fetchPage('members', '/members', more);
+    if (!rows) return;
+    membersData = more ? membersData.concat(rows) : rows;
     renderMembers(membersData);
 }
 
@@ -515,9 +689,10 @@ async function deleteMember(id) {
 }
 
 // Transactions Page
-async function loadTransactionsPage() {
-    const result = await fetchAPI('/transactions/current');
-    transactionsData = result?.data || [];
+async function loadTransactionsPage(more = false) {
+    const rows = await fetchPage('transactions', '/transactions/current', more);
+    if (!rows) return;
+    transactionsData = more ? transactionsData.concat(rows) : rows;
     renderTransactions(transactionsData);
 }
 
@@ -564,32 +739,59 @@ async function quickReturn(txnId) {
 }
 
 // Borrow/Return Page - Redesigned
+let memberLookupTimer = null;
+let copyLookupTimer = null;
+
+// Typeahead: fill the member select with the top matches for the typed text
+function lookupMembers(immediate = false) {
+    if (memberLookupTimer) clearTimeout(memberLookupTimer);
+    return new Promise(resolve => {
+        memberLookupTimer = setTimeout(async () => {
+            const q = document.getElementById('borrowMemberSearch')?.value.trim() || '';
+            const result = await fetchAPI(`/desk/lookup/members?q=${encodeURIComponent(q)}`);
+            const memberSelect = document.getElementById('borrowMember');
+            if (memberSelect) {
+                const members = result?.data || [];
+                memberSelect.innerHTML = (members.length ? '<option value="">Select member...</option>' : '<option value="">No matching members</option>') +
+                    members.map(m => `<option value="${m.id}">${escapeHtml(m.full_name)} (${escapeHtml(m.email)})</option>`).join('');
+                if (members.length === 1) memberSelect.value = members[0].id;
+            }
+            resolve(result);
+        }, immediate === true ? 0 : 120);
+    });
+}
+
+// Typeahead: available copies grouped per title
+function lookupCopies(immediate = false) {
+    if (copyLookupTimer) clearTimeout(copyLookupTimer);
+    return new Promise(resolve => {
+        copyLookupTimer = setTimeout(async () => {
+            const q = document.getElementById('borrowBookSearch')?.value.trim() || '';
+            const result = await fetchAPI(`/desk/lookup/copies?q=${encodeURIComponent(q)}`);
+            const bookSelect = document.getElementById('borrowBook');
+            availableBooksData = result?.data || [];
+            if (bookSelect) {
+                if (availableBooksData.length === 0) {
+                    bookSelect.innerHTML = '<option value="">No books available</option>';
+                } else {
+                    bookSelect.innerHTML = '<option value="">Select book...</option>' +
+                        availableBooksData.map(b => `<optgroup label="${escapeHtml(b.title)} by ${escapeHtml(b.author)}">` +
+                            b.copy_ids.map((id, i) => `<option value="${id}">${escapeHtml(b.title)} (copy ${i + 1} of ${b.copy_ids.length})</option>`).join('') +
+                            '</optgroup>').join('');
+                }
+            }
+            resolve(result);
+        }, immediate === true ? 0 : 120);
+    });
+}
 async function loadBorrowPage() {
-    const [members, books, txns] = await Promise.all([
-        fetchAPI('/members'),
-        fetchAPI('/books/available'),
+    // Member and book pickers are typeahead-driven; only active loans are preloaded
+    const [, , txns] = await Promise.all([
+        lookupMembers(true),
+        lookupCopies(true),
         fetchAPI('/transactions/current')
     ]);
     
-    // Populate member dropdown
-    const memberSelect = document.getElementById('borrowMember');
-    if (memberSelect) {
-        memberSelect.innerHTML = '<option value="">Select member...</option>' + 
-            (members?.data || []).map(m => `<option value="${m.id}">${escapeHtml(m.full_name)} (${escapeHtml(m.email)})</option>`).join('');
-    }
-    
-    // Populate available books dropdown
-    const bookSelect = document.getElementById('borrowBook');
-    availableBooksData = books?.data || [];
-    if (bookSelect) {
-        if (availableBooksData.length === 0) {
-            bookSelect.innerHTML = '<option value="">No books available</option>';
-        } else {
-            bookSelect.innerHTML = '<option value="">Select book...</option>' + 
-                availableBooksData.map(b => `<option value="${b.copy_id}">${escapeHtml(b.title)} by ${escapeHtml(b.author)}</option>`).join('');
-        }
-    }
-    
     // Set due date placeholder
     const dueDate = document.getElementById('dueDate');
     if (dueDate) {
@@ -598,8 +800,13 @@ async function loadBorrowPage() {
         dueDate.value = due.toLocaleDateString('en-US', { weekday: 'short', month: 'short', day: 'numeric', year: 'numeric' });
     }
     
+    currentTxnsData = [...(txns?.data || [])];
+    renderReturnOptions(currentTxnsData);
+}
+
+function renderReturnOptions(txns) {
     // Populate return dropdown with active transactions
-    const activeTxns = (txns?.data || []).filter(t => !t.return_date);
+    const activeTxns = txns.filter(t => !t.return_date);
     const returnSelect = document.getElementById('returnTransaction');
     if (returnSelect) {
         if (activeTxns.length === 0) {
@@ -727,6 +934,7 @@ async function returnBook(e) {
 
 // ==================== MEMBER PAGES ====================
 async function loadMyBooksPage() {
+    const recommendations = loadMyRecommendations();
     const result = await fetchAPI('/my/books');
     const books = result?.data || [];
     const tbody = document.getElementById('myBooksBody');
@@ -743,6 +951,22 @@ async function loadMyBooksPage() {
             <td><span class="status-badge ${statusClass}">${status}</span></td>
         </tr>
     `}).join('') || '<tr><td colspan="4">No books currently borrowed</td></tr>';
+    await recommendations;
+}
+
+async function loadMyRecommendations() {
+    const result = await fetchAPI('/my/recommendations');
+    const books = result?.data || [];
+    const tbody = document.getElementById('myRecommendationsBody');
+    if (!tbody) return;
+    
+    tbody.innerHTML = books.map(b => `
+        <tr>
+            <td><strong>${escapeHtml(b.title || '-')}</strong></td>
+            <td>${escapeHtml(b.author || '-')}</td>
+            <td>${escapeHtml(b.language || '-')}</td>
+        </tr>
+    `).join('') || '<tr><td colspan="3">Borrow a few books to get recommendations</td></tr>';
 }
 
 async function loadMyHistoryPage() {
@@ -1,19 +1,3 @@
-// Initialize Supabase client (for realtime only)
-let supabaseClient = null;
-
-function initSupabase() {
-    try {
-        if (typeof window.supabase !== 'undefined' && window.supabase.createClient) {
-            supabaseClient = window.supabase.createClient(SUPABASE_URL, SUPABASE_KEY);
-            console.log('Supabase client initialized');
-        } else {
-            console.warn('Supabase library not loaded');
-        }
-    } catch(e) {
-        console.error('Supabase init error:', e);
-    }
-}
-
 let currentUser = null;
 let jwtToken = null;
 let userRole = null;
@@ -147,14 +131,9 @@ function logout() {
     localStorage.removeItem('jwt_token');
     localStorage.removeItem('user_email');
     localStorage.removeItem('user_role');
+    clearResponseCache();
+    stopRealtime();
     showAuthPage();
-    if (supabaseClient) {
-        try {
-            supabaseClient.removeAllChannels();
-        } catch (e) {
-            console.warn('Error removing channels:', e);
-        }
-    }
 }
 
 // Show auth page
@@ -263,6 +242,5 @@ document.getElementById('registerForm').addEventListener('submit', async (e) =>
 
 // Initialize on load
 document.addEventListener('DOMContentLoaded', () => {
-    initSupabase();
     checkSession();
 });